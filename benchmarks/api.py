@@ -0,0 +1,101 @@
+"""JSON API против HTML-страниц на одних и тех же данных.
+
+    python benchmarks/api.py --posts 20000 --json api.json
+
+Для каждой пары (страница сайта и запрос API с тем же содержимым)
+меряются p50/p95, запросы в секунду и размер ответа — как есть и после
+gzip. Данные и WSGI-вызов те же, что в benchmarks/endpoints.py;
+--cold чистит кэш перед каждым запросом, чтобы сравнивать рендер,
+а не кэш страниц.
+"""
+import argparse
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import dump_json, setup_django  # noqa: E402
+from endpoints import (add_seed_arguments, drive, route_kwargs, seed,  # noqa: E402,E501
+                       session_cookie, wsgi_request)
+
+
+def pairs():
+    """(название, путь HTML, путь API, нужен ли вход)."""
+    values = route_kwargs()
+    post, slug = values['post_id'], values['slug']
+    username = values['username']
+    return [
+        ('index', '/', '/api/v1/posts/', False),
+        ('group', f'/group/{slug}/', f'/api/v1/posts/?group={slug}', False),
+        ('profile', f'/profile/{username}/',
+         f'/api/v1/posts/?author={username}', False),
+        ('post', f'/posts/{post}/', f'/api/v1/posts/{post}/', False),
+        ('comments', f'/posts/{post}/', f'/api/v1/posts/{post}/comments/',
+         False),
+        ('feed', '/follow/', '/api/v1/feed/', True),
+    ]
+
+
+def api_token():
+    from api.auth import issue_token
+    from posts.models import User
+
+    return issue_token(User.objects.get(username='user0'))
+
+
+def sizes(application, path, extra):
+    _, body = wsgi_request(application, path, extra)
+    return {'bytes': len(body), 'gzip_bytes': len(gzip.compress(body))}
+
+
+def measure(application, path, extra, args):
+    for _ in range(args.warmup):
+        wsgi_request(application, path, extra)
+    report = drive(lambda: wsgi_request(application, path, extra)[0],
+                   args.requests, 1, args.cold)
+    report.update(sizes(application, path, extra))
+    return report
+
+
+def run(args):
+    from yatube.wsgi import application
+
+    html_extra = {'HTTP_COOKIE': session_cookie()}
+    api_extra = {'HTTP_AUTHORIZATION': f'Token {api_token()}'}
+    results = []
+    for name, html_path, api_path, login in pairs():
+        row = {
+            'name': name,
+            'html': measure(application, html_path,
+                            html_extra if login else {}, args),
+            'api': measure(application, api_path,
+                           api_extra if login else {}, args),
+        }
+        results.append(row)
+        print(f'{name:<10} '
+              f'{row["html"]["rps"]:>9} {row["api"]["rps"]:>9} '
+              f'{row["html"]["p95_ms"]:>9} {row["api"]["p95_ms"]:>9} '
+              f'{row["html"]["gzip_bytes"]:>9} {row["api"]["gzip_bytes"]:>9}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_seed_arguments(parser)
+    parser.add_argument('--cold', action='store_true',
+                        help='чистить кэш перед каждым запросом')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    setup_django()
+    seed(args)
+    print(f'{"":<10} {"html rps":>9} {"api rps":>9} {"html p95":>9} '
+          f'{"api p95":>9} {"html gz":>9} {"api gz":>9}')
+    results = run(args)
+    if args.json:
+        dump_json(args.json, {'args': vars(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Общая подготовка окружения для бенчмарков Yatube.
+
+Бенчмарки запускаются из корня репозитория, например:
+
+    python benchmarks/pagination.py --posts 100000
+
+Каждый прогон работает с отдельными временными SQLite-базой, кэшем
+и медиа, рабочие db.sqlite3 и кэш не трогаются.
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(ROOT, 'yatube')
+
+
+def setup_django(db_path=None):
+    """Настраивает Django на временную базу и прогоняет миграции."""
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+    from django.conf import settings
+    workdir = tempfile.mkdtemp(prefix='yatube-bench-')
+    settings.DATABASES['default']['NAME'] = (
+        db_path or os.path.join(workdir, 'bench.sqlite3'))
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.CACHES['default']['LOCATION'] = os.path.join(workdir, 'cache')
+    settings.DEBUG = False
+    # Превышение бюджета запросов в бенчмарке — повод для лога, не 500
+    settings.QUERY_BUDGET_RAISE = False
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+    return workdir
+
+
+def spread_pub_dates():
+    """Разносит pub_date постов по секундам в порядке id.
+
+    bulk_create с auto_now_add ставит всем постам одно время, а в живой
+    базе даты различаются — без этого keyset-сравнение было бы нечестным.
+    """
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE posts_post SET pub_date = "
+            "datetime('2020-01-01', '+' || id || ' seconds')"
+        )
+
+
+def timed(func, repeat):
+    """Запускает func repeat раз и возвращает список длительностей в мс."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'min_ms': round(min(samples), 3),
+    }
+
+
+def latency(samples):
+    """Перцентили задержки для отчётов по эндпоинтам."""
+    return {
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+    }
+
+
+def load_json(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def dump_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(payload, output, ensure_ascii=False, indent=2)
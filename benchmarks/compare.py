@@ -0,0 +1,66 @@
+"""Сравнение двух прогонов benchmarks/endpoints.py.
+
+    python benchmarks/compare.py base.json new.json --threshold 20
+
+Печатает изменение p95, RPS и числа SQL-запросов по каждому эндпоинту.
+Код выхода 1, если p95 вырос больше чем на threshold процентов или
+эндпоинт стал делать больше запросов, — так сравнение можно ставить
+шагом в CI.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import load_json  # noqa: E402
+
+
+def key(row):
+    return row['mode'], row['user'], row['endpoint']
+
+
+def change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def compare(base, new, threshold):
+    """Строки отчёта и список регрессий."""
+    base_rows = {key(row): row for row in base['results']}
+    lines, regressions = [], []
+    for row in new['results']:
+        old = base_rows.get(key(row))
+        if old is None:
+            continue
+        p95 = change(old['p95_ms'], row['p95_ms'])
+        rps = change(old['rps'], row['rps'])
+        queries = row['queries'] - old['queries']
+        name = ' '.join(key(row))
+        lines.append(f'{name:<44} {p95:>+8.1f}% {rps:>+8.1f}% {queries:>+5}')
+        if p95 > threshold or queries > 0:
+            regressions.append(name)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='допустимый рост p95, в процентах')
+    args = parser.parse_args()
+
+    lines, regressions = compare(load_json(args.base), load_json(args.new),
+                                 args.threshold)
+    print(f'{"endpoint":<44} {"p95":>9} {"rps":>9} {"sql":>5}')
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\nРегрессии ({len(regressions)}):')
+        print('\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""Нагрузочный прогон всех страниц posts.urls и users.urls.
+
+    python benchmarks/endpoints.py --posts 20000 --json before.json
+    python benchmarks/compare.py before.json after.json
+
+Скрипт заполняет временную базу синтетикой: пользователи, группы, посты
+с картинками, комментарии и граф подписок со степенным распределением
+(у немногих авторов тысячи подписчиков, у большинства единицы). Затем
+каждый маршрут вызывается через WSGI-приложение yatube/wsgi.py — прямо
+в процессе и через локальный HTTP-сервер, анонимно и под пользователем.
+
+По каждому эндпоинту в отчёте p50/p95/p99, запросы в секунду, число
+SQL-запросов и пик памяти Python на один запрос.
+"""
+import argparse
+import io
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import dump_json, latency, setup_django, spread_pub_dates  # noqa: E402,E501
+
+PASSWORD = 'bench-password'
+IMAGES = 50
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def write_images():
+    from django.conf import settings
+
+    folder = os.path.join(settings.MEDIA_ROOT, 'posts')
+    os.makedirs(folder, exist_ok=True)
+    names = []
+    for i in range(IMAGES):
+        name = f'posts/bench_{i}.gif'
+        with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as image:
+            image.write(SMALL_GIF)
+        names.append(name)
+    return names
+
+
+def seed_users(rnd, users):
+    """Пользователи и их «популярность» — веса со степенным хвостом."""
+    from django.contrib.auth.hashers import make_password
+    from posts.models import User
+
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(username=f'user{i}', password=password) for i in range(users))
+    ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    weights = [rnd.paretovariate(1.2) for _ in ids]
+    return ids, weights
+
+
+def seed_follows(rnd, ids, weights, per_user):
+    from posts.models import Follow
+
+    follows = []
+    for user_id in ids:
+        authors = set(rnd.choices(ids, weights, k=per_user)) - {user_id}
+        follows.extend(Follow(user_id=user_id, author_id=author_id)
+                       for author_id in authors)
+    Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+
+def seed_posts(rnd, ids, weights, args):
+    from posts.models import Group, Post
+
+    Group.objects.bulk_create(
+        Group(title=f'Группа {i}', slug=f'group-{i}',
+              description='Описание группы') for i in range(args.groups))
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    images = write_images()
+    batch = 5000
+    for start in range(0, args.posts, batch):
+        Post.objects.bulk_create(
+            Post(author_id=rnd.choices(ids, weights)[0],
+                 group_id=rnd.choice(group_ids) if rnd.random() < .5 else None,
+                 text=f'Пост {i} про котов и собак',
+                 image=(rnd.choice(images)
+                        if rnd.random() < args.image_share else ''))
+            for i in range(start, min(args.posts, start + batch))
+        )
+    spread_pub_dates()
+
+
+def seed_comments(rnd, ids, comments):
+    from posts.models import Comment, Post
+
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    batch = 5000
+    for start in range(0, comments, batch):
+        Comment.objects.bulk_create(
+            Comment(post_id=rnd.choice(post_ids), author_id=rnd.choice(ids),
+                    text=f'Комментарий {i}')
+            for i in range(start, min(comments, start + batch))
+        )
+
+
+def seed(args):
+    """Заполняет базу; bulk_create не шлёт сигналы, поэтому счётчики,
+    ленты и поисковый индекс потом пересобираются целиком."""
+    from django.core.management import call_command
+    from posts.counters import recount
+
+    rnd = random.Random(args.seed)
+    ids, weights = seed_users(rnd, args.users)
+    seed_follows(rnd, ids, weights, args.follows)
+    seed_posts(rnd, ids, weights, args)
+    seed_comments(rnd, ids, args.comments)
+    recount()
+    call_command('rebuild_feeds', stdout=io.StringIO())
+    call_command('reindex_search', stdout=io.StringIO())
+
+
+def route_kwargs():
+    """Значения параметров маршрутов: популярный автор, его пост и т.д."""
+    from django.contrib.auth.tokens import default_token_generator
+    from django.utils.encoding import force_bytes
+    from django.utils.http import urlsafe_base64_encode
+    from posts.models import Group, Post, User
+
+    author = User.objects.order_by('-stats__followers_count').first()
+    reader = User.objects.get(username='user0')
+    post = Post.objects.filter(author=author).order_by('-pk').first()
+    return {
+        'slug': Group.objects.order_by('-posts_count').first().slug,
+        'username': author.username,
+        'post_id': (post or Post.objects.order_by('-pk').first()).pk,
+        'uidb64': urlsafe_base64_encode(force_bytes(reader.pk)),
+        'token': default_token_generator.make_token(reader),
+    }
+
+
+def endpoints():
+    """(имя URL, путь) для каждого маршрута posts.urls и users.urls."""
+    from django.urls import reverse
+    from posts.urls import urlpatterns as posts_urls
+    from users.urls import urlpatterns as users_urls
+
+    values = route_kwargs()
+    found = []
+    for namespace, patterns in (('posts', posts_urls),
+                                ('users', users_urls)):
+        for pattern in patterns:
+            name = f'{namespace}:{pattern.name}'
+            kwargs = {key: values[key]
+                      for key in pattern.pattern.converters}
+            path = reverse(name, kwargs=kwargs)
+            if name == 'posts:search':
+                path += '?' + urlencode({'q': 'кот'})
+            found.append((name, path))
+    return found
+
+
+def session_cookie():
+    from django.conf import settings
+    from django.test import Client
+    from posts.models import User
+
+    client = Client()
+    client.force_login(User.objects.get(username='user0'))
+    session = client.cookies[settings.SESSION_COOKIE_NAME].value
+    return f'{settings.SESSION_COOKIE_NAME}={session}'
+
+
+def wsgi_request(application, path, extra=None, data=None):
+    """Один запрос прямо через WSGI-приложение: (статус, тело).
+
+    С data уходит POST с телом формы, иначе GET.
+    """
+    path, _, query = path.partition('?')
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query}
+    if data is not None:
+        body = urlencode(data).encode()
+        environ.update({
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        })
+    environ.update(extra or {})
+    setup_testing_defaults(environ)
+    status = []
+    body = application(
+        environ, lambda line, headers, exc_info=None: status.append(line))
+    try:
+        content = b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(status[0].split()[0]), content
+
+
+def wsgi_get(application, path, cookie):
+    extra = {'HTTP_COOKIE': cookie} if cookie else {}
+    return wsgi_request(application, path, extra)[0]
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def start_server(application):
+    server = make_server('127.0.0.1', 0, application,
+                         server_class=ThreadingServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def http_get(port, path, cookie):
+    connection = HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path,
+                           headers={'Cookie': cookie} if cookie else {})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def measure_once(application, path, cookie):
+    """Число SQL-запросов и пик памяти для одного запроса в процессе."""
+    from core.middleware import QueryCounter
+    from django.db import connection
+
+    counter = QueryCounter()
+    tracemalloc.start()
+    with connection.execute_wrapper(counter):
+        wsgi_get(application, path, cookie)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'queries': counter.count, 'peak_kb': round(peak / 1024, 1)}
+
+
+def drive(call, requests, concurrency, cold):
+    """Прогоняет requests вызовов call и считает задержки и RPS."""
+    from django.core.cache import cache
+
+    def one(_):
+        if cold:
+            cache.clear()
+        start = time.perf_counter()
+        status = call()
+        return (time.perf_counter() - start) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    samples = [duration for duration, _ in results]
+    report = latency(samples)
+    report['rps'] = round(requests / elapsed, 1)
+    report['status'] = sorted({status for _, status in results})
+    return report
+
+
+def run(args):
+    from yatube.wsgi import application
+
+    cookies = {'anon': '', 'auth': session_cookie()}
+    server = start_server(application) if 'http' in args.modes else None
+    results = []
+    for name, path in endpoints():
+        for user in args.as_users:
+            # Выход из аккаунта убил бы сессию для остальных замеров
+            if user == 'auth' and name == 'users:logout':
+                continue
+            cookie = cookies[user]
+            calls = {
+                'wsgi': lambda: wsgi_get(application, path, cookie),
+                'http': lambda: http_get(server.server_port, path, cookie),
+            }
+            for _ in range(args.warmup):
+                calls['wsgi']()
+            once = measure_once(application, path, cookie)
+            for mode in args.modes:
+                concurrency = 1 if mode == 'wsgi' else args.concurrency
+                row = {'endpoint': name, 'path': path, 'user': user,
+                       'mode': mode}
+                row.update(drive(calls[mode], args.requests, concurrency,
+                                 args.cold))
+                row.update(once)
+                results.append(row)
+                print_row(row)
+    if server:
+        server.shutdown()
+    return results
+
+
+def print_row(row):
+    print(f'{row["mode"]:<5} {row["user"]:<5} {row["endpoint"]:<32} '
+          f'{row["p50_ms"]:>8} {row["p95_ms"]:>8} {row["p99_ms"]:>8} '
+          f'{row["rps"]:>8} {row["queries"]:>4} {row["peak_kb"]:>9}')
+
+
+def meta(args):
+    import django
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        max_rss = None
+    return {
+        'args': vars(args),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'max_rss_kb': max_rss,
+    }
+
+
+def add_seed_arguments(parser):
+    """Параметры синтетических данных и прогона, общие для бенчмарков."""
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--follows', type=int, default=20,
+                        help='сколько авторов выбирает каждый пользователь')
+    parser.add_argument('--image-share', type=float, default=.3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='запросов на эндпоинт в каждом режиме')
+    parser.add_argument('--warmup', type=int, default=3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_seed_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='параллельных клиентов в режиме http')
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'http'],
+                        default=['wsgi', 'http'])
+    parser.add_argument('--as-users', nargs='+', choices=['anon', 'auth'],
+                        default=['anon', 'auth'])
+    parser.add_argument('--cold', action='store_true',
+                        help='чистить кэш перед каждым запросом')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    setup_django()
+    seed(args)
+    print(f'{"mode":<5} {"user":<5} {"endpoint":<32} {"p50":>8} '
+          f'{"p95":>8} {"p99":>8} {"rps":>8} {"sql":>4} {"peak_kb":>9}')
+    results = run(args)
+    if args.json:
+        dump_json(args.json, {'meta': meta(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
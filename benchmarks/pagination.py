@@ -0,0 +1,88 @@
+"""Сравнение offset- и keyset-пагинации ленты постов.
+
+    python benchmarks/pagination.py --posts 100000 --pages 1 100 10000
+
+Для каждой глубины меряется получение страницы целиком: для Paginator —
+COUNT(*) и выборка с OFFSET, для CursorPaginator — выборка от курсора.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import dump_json, setup_django, spread_pub_dates, summarize, timed  # noqa: E402,E501
+
+
+def seed(posts):
+    from django.contrib.auth import get_user_model
+    from posts.models import Post
+
+    author = get_user_model().objects.create_user(username='bench-author')
+    batch = 5000
+    for start in range(0, posts, batch):
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {i}')
+            for i in range(start, min(posts, start + batch))
+        )
+    spread_pub_dates()
+
+
+def run(pages, repeat, per_page):
+    from django.core.paginator import Paginator
+    from posts.models import Post
+    from posts.paginators import NEXT, CursorPaginator
+
+    queryset = Post.objects.select_related('author', 'group')
+    results = []
+    for number in pages:
+        def offset_page():
+            page = Paginator(queryset, per_page).get_page(number)
+            list(page)
+
+        # Курсор берём с последнего поста предыдущей страницы,
+        # как если бы читатель дошёл до неё по ссылкам «Следующая».
+        keyset = CursorPaginator(queryset, per_page)
+        cursor = None
+        if number > 1:
+            anchor = queryset.order_by('-pub_date', '-id')[
+                (number - 1) * per_page - 1]
+            cursor = keyset.encode_cursor(NEXT, anchor)
+
+        def keyset_page():
+            list(keyset.get_page(cursor))
+
+        results.append({
+            'page': number,
+            'offset': summarize(timed(offset_page, repeat)),
+            'keyset': summarize(timed(keyset_page, repeat)),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--pages', type=int, nargs='+',
+                        default=[1, 100, 10000])
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    setup_django()
+    seed(args.posts)
+    max_page = -(-args.posts // args.per_page)
+    pages = [page for page in args.pages if page <= max_page]
+    results = run(pages, args.repeat, args.per_page)
+
+    print(f'{"page":>8} {"offset, ms":>12} {"keyset, ms":>12}')
+    for row in results:
+        print(f'{row["page"]:>8} {row["offset"]["median_ms"]:>12} '
+              f'{row["keyset"]["median_ms"]:>12}')
+    if args.json:
+        dump_json(args.json, {'posts': args.posts, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Медленные клиенты: sync-воркеры WSGI против yatube/asgi.py.
+
+    python benchmarks/slow_clients.py --workers 4 --slow 8 --duration 10
+
+На обоих серверах у Django одинаковое число потоков (--workers). WSGI
+моделирует gunicorn с sync-воркерами: соединение занимает поток от
+первого байта запроса до последнего байта ответа. ASGI-сервер — простой
+HTTP/1.1 на asyncio. Он читает запрос в цикле событий и отдаёт готовый
+запрос приложению yatube.asgi, которое держит поток только на время
+представления.
+
+--slow клиентов шлют заголовки по байту в --drip секунд, как телефон
+на плохой связи, и так по кругу. --fast клиентов в это время читают
+ленту и посты. В отчёте p50/p95 и RPS быстрых клиентов и число
+запросов, которые медленные клиенты успели завершить.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import dump_json, latency, setup_django  # noqa: E402
+from endpoints import (QuietHandler, add_seed_arguments, http_get,  # noqa: E402,E501
+                       seed)
+
+
+class SyncWorkersServer(WSGIServer):
+    """WSGI-сервер, где соединение обслуживает один из workers потоков."""
+
+    def __init__(self, *args, workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_and_close, request, client_address)
+
+    def handle_and_close(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def start_wsgi(application, workers):
+    server = make_server('127.0.0.1', 0, application,
+                         server_class=lambda *args, **kwargs:
+                         SyncWorkersServer(*args, workers=workers, **kwargs),
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+async def serve_connection(application, reader, writer):
+    """Один запрос HTTP/1.1 без keep-alive в ASGI-приложение."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+        return
+    request_line, *lines = head.decode('latin-1').split('\r\n')[:-2]
+    method, target, version = request_line.split(' ', 2)
+    path, _, query = target.partition('?')
+    headers = []
+    for line in lines:
+        name, _, value = line.partition(':')
+        headers.append((name.strip().lower().encode('latin-1'),
+                        value.strip().encode('latin-1')))
+    length = int(dict(headers).get(b'content-length', 0))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'},
+        'http_version': version.split('/')[1], 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode('latin-1'), 'root_path': '',
+        'headers': headers, 'client': writer.get_extra_info('peername'),
+        'server': writer.get_extra_info('sockname'),
+    }
+
+    async def receive():
+        body = await reader.readexactly(length) if length else b''
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            lines = [f'HTTP/1.1 {message["status"]} -'.encode()]
+            lines += [name + b': ' + value
+                      for name, value in message['headers']]
+            lines.append(b'Connection: close')
+            writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
+        else:
+            writer.write(message.get('body', b''))
+        await writer.drain()
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        writer.close()
+
+
+def start_asgi(application):
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    port = []
+
+    async def main():
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_connection(
+                application, reader, writer), '127.0.0.1', 0, backlog=1024)
+        port.append(server.sockets[0].getsockname()[1])
+        started.set()
+        await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(main(),),
+                     daemon=True).start()
+    started.wait()
+    return port[0]
+
+
+def slow_client(port, path, drip, stop, done):
+    """Шлёт запрос по байту, пока не выйдет время прогона."""
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+               f'User-Agent: slow-phone\r\n\r\n').encode()
+    while not stop.is_set():
+        with socket.create_connection(('127.0.0.1', port)) as sock:
+            for byte in request:
+                if stop.is_set():
+                    return
+                sock.sendall(bytes([byte]))
+                time.sleep(drip)
+            while sock.recv(65536):
+                pass
+        done.append(1)
+
+
+def fast_client(port, paths, seed, stop, samples):
+    rnd = random.Random(seed)
+    while not stop.is_set():
+        start = time.perf_counter()
+        http_get(port, rnd.choice(paths), '')
+        samples.append((time.perf_counter() - start) * 1000)
+
+
+def run_server(name, port, paths, args):
+    stop = threading.Event()
+    samples, slow_done = [], []
+    threads = [threading.Thread(target=slow_client,
+                                args=(port, paths[0], args.drip, stop,
+                                      slow_done))
+               for _ in range(args.slow)]
+    threads += [threading.Thread(target=fast_client,
+                                 args=(port, paths, args.seed + number, stop,
+                                       samples))
+                for number in range(args.fast)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    return {
+        'name': name,
+        'fast_requests': len(samples),
+        'fast_rps': round(len(samples) / args.duration, 1),
+        'fast': latency(samples) if samples else None,
+        'slow_completed': len(slow_done),
+    }
+
+
+def print_row(row):
+    fast = row['fast'] or {'p50_ms': '-', 'p95_ms': '-'}
+    print(f'{row["name"]:<5} {row["fast_rps"]:>9} {fast["p50_ms"]:>10} '
+          f'{fast["p95_ms"]:>10} {row["slow_completed"]:>6}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_seed_arguments(parser)
+    parser.set_defaults(users=100, posts=2000, comments=2000, follows=5)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='потоков Django на обоих серверах')
+    parser.add_argument('--slow', type=int, default=8,
+                        help='медленных клиентов')
+    parser.add_argument('--fast', type=int, default=4,
+                        help='обычных клиентов')
+    parser.add_argument('--drip', type=float, default=.05,
+                        help='секунд между байтами медленного клиента')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='секунд нагрузки на сервер')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    setup_django()
+    seed(args)
+    from django.conf import settings
+    from posts.models import Post
+
+    settings.ASGI_THREADS = args.workers
+    from yatube.asgi import application as asgi_application
+    from yatube.wsgi import application as wsgi_application
+
+    paths = ['/'] + [f'/posts/{pk}/' for pk in
+                     Post.objects.values_list('pk', flat=True)[:50]]
+    servers = [
+        ('wsgi', start_wsgi(wsgi_application, args.workers)),
+        ('asgi', start_asgi(asgi_application)),
+    ]
+    print(f'{"server":<5} {"fast rps":>9} {"fast p50":>10} '
+          f'{"fast p95":>10} {"slow":>6}')
+    results = []
+    for name, port in servers:
+        row = run_server(name, port, paths, args)
+        print_row(row)
+        results.append(row)
+    if args.json:
+        dump_json(args.json, {'args': vars(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
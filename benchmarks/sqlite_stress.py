@@ -0,0 +1,174 @@
+"""Конкурентные чтение и запись SQLite: голая база против SQLITE_PRAGMAS.
+
+    python benchmarks/sqlite_stress.py --workers 8 --duration 10
+
+Воркеры — отдельные процессы, как у gunicorn. Каждый ходит через
+WSGI-приложение под своим пользователем: читает ленту и страницы постов
+и с долей --write-share создаёт посты (post_create) и комментарии
+(add_comment). Каждый профиль получает свежую базу: journal_mode
+хранится в самом файле, и WAL от прошлого прогона исказил бы «до».
+
+В отчёте по профилю: операции в секунду, число ошибок «database is
+locked» и их доля, p95 чтения и записи.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import dump_json, latency, setup_django  # noqa: E402
+from endpoints import add_seed_arguments, seed, wsgi_request  # noqa: E402
+
+# Токен CSRF для POST-форм: одинаковый в cookie и в поле формы
+CSRF_SECRET = 'b' * 32
+
+
+def profiles():
+    """(название, PRAGMA, CONN_MAX_AGE)."""
+    from django.conf import settings
+
+    return [
+        ('default', {}, 0),
+        ('tuned', dict(settings.SQLITE_PRAGMAS),
+         settings.DATABASES['default'].get('CONN_MAX_AGE', 0)),
+    ]
+
+
+def user_cookie(username):
+    from django.conf import settings
+    from django.test import Client
+    from posts.models import User
+
+    client = Client()
+    client.force_login(User.objects.get(username=username))
+    session = client.cookies[settings.SESSION_COOKIE_NAME].value
+    return (f'{settings.SESSION_COOKIE_NAME}={session}; '
+            f'{settings.CSRF_COOKIE_NAME}={CSRF_SECRET}')
+
+
+def next_request(rnd, post_ids, write_share):
+    """(пишет ли, путь, данные формы или None)."""
+    post_id = rnd.choice(post_ids)
+    if rnd.random() < write_share:
+        if rnd.random() < .5:
+            return True, '/create/', {
+                'text': 'Пост под нагрузкой',
+                'csrfmiddlewaretoken': CSRF_SECRET}
+        return True, f'/posts/{post_id}/comment/', {
+            'text': 'Комментарий под нагрузкой',
+            'csrfmiddlewaretoken': CSRF_SECRET}
+    if rnd.random() < .5:
+        return False, '/', None
+    return False, f'/posts/{post_id}/', None
+
+
+def worker(number, cookie, post_ids, args):
+    """Гоняет запросы args.duration секунд в отдельном процессе."""
+    from django.core.signals import got_request_exception
+    from yatube.wsgi import application
+
+    errors = {'locked': 0, 'other': 0}
+
+    def count_error(sender, **kwargs):
+        error = sys.exc_info()[1]
+        errors['locked' if 'locked' in str(error) else 'other'] += 1
+
+    got_request_exception.connect(count_error, weak=False)
+    rnd = random.Random(args.seed + number)
+    samples = {True: [], False: []}
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        write, path, data = next_request(rnd, post_ids, args.write_share)
+        start = time.perf_counter()
+        wsgi_request(application, path, {'HTTP_COOKIE': cookie}, data)
+        samples[write].append((time.perf_counter() - start) * 1000)
+    return {'reads': samples[False], 'writes': samples[True], **errors}
+
+
+def prepare(workdir, name, pragmas, conn_max_age, args):
+    """Свежая база профиля с данными; возвращает cookie и id постов."""
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connections
+    from posts.models import Post
+
+    connections.close_all()
+    settings.SQLITE_PRAGMAS = pragmas
+    settings.DATABASES['default'].update(
+        NAME=os.path.join(workdir, f'stress-{name}.sqlite3'),
+        CONN_MAX_AGE=conn_max_age)
+    call_command('migrate', verbosity=0, interactive=False)
+    seed(args)
+    cookies = [user_cookie(f'user{i % args.users}')
+               for i in range(args.workers)]
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    # Дочерние процессы не должны делить соединение родителя
+    connections.close_all()
+    return cookies, post_ids
+
+
+def run_profile(workdir, name, pragmas, conn_max_age, args):
+    cookies, post_ids = prepare(workdir, name, pragmas, conn_max_age, args)
+    context = multiprocessing.get_context('fork')
+    with context.Pool(args.workers) as pool:
+        results = pool.starmap(worker, [
+            (number, cookies[number], post_ids, args)
+            for number in range(args.workers)])
+    reads = [ms for result in results for ms in result['reads']]
+    writes = [ms for result in results for ms in result['writes']]
+    locked = sum(result['locked'] for result in results)
+    total = len(reads) + len(writes)
+    return {
+        'name': name,
+        'pragmas': pragmas,
+        'conn_max_age': conn_max_age,
+        'ops_per_s': round(total / args.duration, 1),
+        'reads': len(reads),
+        'writes': len(writes),
+        'locked': locked,
+        'other_errors': sum(result['other'] for result in results),
+        'locked_share': round(locked / total, 4) if total else 0,
+        'read': latency(reads) if reads else None,
+        'write': latency(writes) if writes else None,
+    }
+
+
+def print_row(row):
+    read_p95 = row['read']['p95_ms'] if row['read'] else '-'
+    write_p95 = row['write']['p95_ms'] if row['write'] else '-'
+    print(f'{row["name"]:<8} {row["ops_per_s"]:>9} {row["writes"]:>7} '
+          f'{row["locked"]:>7} {row["locked_share"]:>8.2%} '
+          f'{read_p95:>9} {write_p95:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_seed_arguments(parser)
+    parser.set_defaults(users=100, posts=2000, comments=2000, follows=5)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='процессов, как воркеров gunicorn')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='секунд нагрузки на профиль')
+    parser.add_argument('--write-share', type=float, default=.2,
+                        help='доля запросов на запись')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    workdir = setup_django()
+    print(f'{"profile":<8} {"ops/s":>9} {"writes":>7} {"locked":>7} '
+          f'{"locked%":>8} {"read p95":>9} {"write p95":>9}')
+    results = []
+    for name, pragmas, conn_max_age in profiles():
+        row = run_profile(workdir, name, pragmas, conn_max_age, args)
+        print_row(row)
+        results.append(row)
+    if args.json:
+        dump_json(args.json, {'args': vars(args), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
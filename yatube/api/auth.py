@@ -0,0 +1,29 @@
+"""Авторизация в API по заголовку «Authorization: Token <ключ>»."""
+import hashlib
+import secrets
+
+from .models import Token
+
+KEYWORD = 'Token'
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(user):
+    """Выдаёт новый токен; сам ключ виден только в этот момент."""
+    key = secrets.token_urlsafe(30)
+    Token.objects.create(user=user, key_hash=hash_key(key))
+    return key
+
+
+def token_user(request):
+    """Пользователь из заголовка Authorization или None."""
+    keyword, _, key = request.META.get(
+        'HTTP_AUTHORIZATION', '').partition(' ')
+    if keyword != KEYWORD or not key:
+        return None
+    token = Token.objects.select_related('user').filter(
+        key_hash=hash_key(key.strip()), user__is_active=True).first()
+    return token.user if token else None
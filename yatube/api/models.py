@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class Token(models.Model):
+    """Токен доступа к API; в базе хранится только sha256 ключа."""
+
+    key_hash = models.CharField(
+        verbose_name='Хэш ключа',
+        max_length=64,
+        unique=True,
+    )
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='api_tokens',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата выдачи',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Токен API'
+        verbose_name_plural = 'Токены API'
+
+    def __str__(self):
+        return f'{self.user} ({self.created:%d.%m.%Y})'
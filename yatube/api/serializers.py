@@ -0,0 +1,69 @@
+"""Перевод моделей в плоские словари для JSON-ответов API.
+
+У каждого типа фиксированный набор полей; клиент может сузить его
+параметром ?fields=id,text (sparse fieldset). Связанные объекты
+отдаются ключами (username, slug), а не вложенными объектами: так
+ответ короче и одинаковые ключи хорошо сжимаются gzip.
+"""
+
+
+class FieldsError(ValueError):
+    """В ?fields= запрошено неизвестное поле."""
+
+
+def _post_image(post, request):
+    if not post.image:
+        return None
+    return request.build_absolute_uri(post.image.url)
+
+
+POST_FIELDS = {
+    'id': lambda post, request: post.pk,
+    'text': lambda post, request: post.text,
+    'pub_date': lambda post, request: post.pub_date.isoformat(),
+    'updated': lambda post, request: post.updated.isoformat(),
+    'author': lambda post, request: post.author.username,
+    'group': lambda post, request: post.group.slug if post.group else None,
+    'image': _post_image,
+    'comments_count': lambda post, request: post.comments_count,
+}
+
+COMMENT_FIELDS = {
+    'id': lambda comment, request: comment.pk,
+    'post': lambda comment, request: comment.post_id,
+    'author': lambda comment, request: comment.author.username,
+    'text': lambda comment, request: comment.text,
+    'created': lambda comment, request: comment.created.isoformat(),
+}
+
+GROUP_FIELDS = {
+    'slug': lambda group, request: group.slug,
+    'title': lambda group, request: group.title,
+    'description': lambda group, request: group.description,
+    'posts_count': lambda group, request: group.posts_count,
+}
+
+USER_FIELDS = {
+    'username': lambda user, request: user.username,
+    'full_name': lambda user, request: user.get_full_name(),
+    'posts_count': lambda user, request: user.stats.posts_count,
+    'followers_count': lambda user, request: user.stats.followers_count,
+    'following_count': lambda user, request: user.stats.following_count,
+}
+
+
+def select_fields(request, available):
+    """Поля из ?fields= в порядке available; по умолчанию — все."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(available)
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names - set(available)
+    if unknown:
+        raise FieldsError(', '.join(sorted(unknown)))
+    return [name for name in available if name in names]
+
+
+def serialize(objects, available, fields, request):
+    return [{name: available[name](obj, request) for name in fields}
+            for obj in objects]
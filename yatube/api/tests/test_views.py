@@ -0,0 +1,214 @@
+import gzip
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from api.auth import issue_token
+from core import ratelimit
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test-author',
+                                              password='secret')
+        cls.reader = User.objects.create_user(username='test-reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Тестовый текст {i}')
+            for i in range(15)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author_headers = {
+            'HTTP_AUTHORIZATION': f'Token {issue_token(self.author)}'}
+        self.reader_headers = {
+            'HTTP_AUTHORIZATION': f'Token {issue_token(self.reader)}'}
+
+    def get_json(self, url, data=None, status=200, **headers):
+        response = self.client.get(url, data, **headers)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def send_json(self, method, url, data, **headers):
+        return getattr(self.client, method)(
+            url, json.dumps(data), content_type='application/json',
+            **headers)
+
+
+class PostsApiTest(ApiTestCase):
+    def test_cursor_pagination_walks_all_posts(self):
+        url = reverse('api:posts')
+        page = self.get_json(url, {'limit': 10})
+        self.assertEqual(len(page['results']), 10)
+        self.assertIsNone(page['previous'])
+
+        rest = self.get_json(url, {'limit': 10, 'cursor': page['next']})
+        self.assertIsNone(rest['next'])
+        ids = [post['id'] for post in page['results'] + rest['results']]
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+
+    def test_sparse_fieldset_and_ids(self):
+        wanted = [self.posts[3].pk, self.posts[0].pk, 10 ** 6]
+        data = self.get_json(reverse('api:posts'), {
+            'ids': ','.join(map(str, wanted)), 'fields': 'id,author'})
+        self.assertEqual(data['results'], [
+            {'id': self.posts[3].pk, 'author': 'test-author'},
+            {'id': self.posts[0].pk, 'author': 'test-author'},
+        ])
+        self.get_json(reverse('api:posts'), {'fields': 'password'},
+                      status=400)
+
+    def test_filters(self):
+        data = self.get_json(reverse('api:posts'), {
+            'group': 'test-slug', 'author': 'test-author', 'limit': 100})
+        self.assertEqual(len(data['results']), 15)
+        data = self.get_json(reverse('api:posts'), {'group': 'other'})
+        self.assertEqual(data['results'], [])
+
+    def test_create_and_edit_post(self):
+        url = reverse('api:posts')
+        response = self.send_json('post', url, {'text': 'Через API'})
+        self.assertEqual(response.status_code, 401)
+
+        response = self.send_json('post', url, {
+            'text': 'Через API', 'group': 'test-slug'}, **self.author_headers)
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+        self.assertEqual(created['group'], 'test-slug')
+
+        detail = reverse('api:post_detail',
+                         kwargs={'post_id': created['id']})
+        response = self.send_json('patch', detail, {'text': 'Правка'},
+                                  **self.reader_headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.send_json('patch', detail, {'text': 'Правка'},
+                                  **self.author_headers)
+        self.assertEqual(response.json()['text'], 'Правка')
+        self.assertEqual(response.json()['group'], 'test-slug')
+
+        response = self.send_json('patch', detail, {'group': 'nope'},
+                                  **self.author_headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('group', response.json()['details'])
+
+    def test_not_found_is_json(self):
+        data = self.get_json(
+            reverse('api:post_detail', kwargs={'post_id': 10 ** 6}),
+            status=404)
+        self.assertIn('error', data)
+
+    def test_gzip(self):
+        response = self.client.get(reverse('api:posts'), {'limit': 100},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(data['results']), 15)
+
+
+class CommentsFollowsApiTest(ApiTestCase):
+    def test_comments(self):
+        post = self.posts[0]
+        url = reverse('api:comments', kwargs={'post_id': post.pk})
+        response = self.send_json('post', url, {'text': 'Коммент'},
+                                  **self.reader_headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['author'], 'test-reader')
+        data = self.get_json(url)
+        self.assertEqual([c['text'] for c in data['results']], ['Коммент'])
+        self.assertEqual(Comment.objects.filter(post=post).count(), 1)
+
+    def test_follow_feed_unfollow(self):
+        self.get_json(reverse('api:feed'), status=401)
+        response = self.send_json('post', reverse('api:follows'),
+                                  {'author': 'test-author'},
+                                  **self.reader_headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.get_json(reverse('api:follows'),
+                          **self.reader_headers)['results'],
+            ['test-author'])
+
+        page = self.get_json(reverse('api:feed'), {'limit': 10},
+                             **self.reader_headers)
+        rest = self.get_json(reverse('api:feed'), {'cursor': page['next']},
+                             **self.reader_headers)
+        self.assertEqual(len(page['results']) + len(rest['results']), 15)
+        self.assertIsNone(rest['next'])
+
+        response = self.client.delete(
+            reverse('api:unfollow', kwargs={'username': 'test-author'}),
+            **self.reader_headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Follow.objects.filter(user=self.reader).exists())
+
+    def test_groups_and_users(self):
+        groups = self.get_json(reverse('api:groups'))['results']
+        self.assertEqual(groups[0]['posts_count'], 15)
+        user = self.get_json(reverse(
+            'api:user_detail', kwargs={'username': 'test-author'}))
+        self.assertEqual(user['posts_count'], 15)
+
+    def test_token(self):
+        response = self.send_json('post', reverse('api:token'), {
+            'username': 'test-author', 'password': 'secret'})
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+        response = self.send_json(
+            'post', reverse('api:follows'), {'author': 'test-reader'},
+            HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.send_json('post', reverse('api:token'), {
+            'username': 'test-author', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RATE_LIMITS={
+    'api:comments': {'user': (2, 60), 'ip': (3, 60)},
+    'api:token': {'ip': (1, 60)},
+})
+class RateLimitApiTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        ratelimit._blocked.clear()
+        ratelimit._reserved.clear()
+
+    def comment(self, headers):
+        url = reverse('api:comments', kwargs={'post_id': self.posts[0].pk})
+        return self.send_json('post', url, {'text': 'Спам'}, **headers)
+
+    def test_token_user_bucket(self):
+        """Ведро пользователя берётся из токена, запрос стоит один токен."""
+        for _ in range(2):
+            self.assertEqual(self.comment(self.author_headers).status_code,
+                             201)
+        response = self.comment(self.author_headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Другой токен с того же IP: своё ведро, но общее ведро IP
+        self.assertEqual(self.comment(self.reader_headers).status_code, 201)
+        self.assertEqual(self.comment(self.reader_headers).status_code, 429)
+        self.assertEqual(self.posts[0].comments.count(), 3)
+
+    def test_token_endpoint_is_limited(self):
+        url = reverse('api:token')
+        response = self.send_json('post', url, {
+            'username': 'test-author', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+        response = self.send_json('post', url, {
+            'username': 'test-author', 'password': 'secret'})
+        self.assertEqual(response.status_code, 429)
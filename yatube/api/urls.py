@@ -0,0 +1,21 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    # Выдача токена по логину и паролю
+    path('token/', views.token, name='token'),
+    path('posts/', views.posts, name='posts'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/', views.comments, name='comments'),
+    path('groups/', views.groups, name='groups'),
+    path('groups/<slug:slug>/', views.group_detail, name='group_detail'),
+    path('users/<str:username>/', views.user_detail, name='user_detail'),
+    # Лента подписок
+    path('feed/', views.feed, name='feed'),
+    # Подписки: список и подписка (POST), отписка (DELETE)
+    path('follows/', views.follows, name='follows'),
+    path('follows/<str:username>/', views.unfollow, name='unfollow'),
+]
@@ -0,0 +1,293 @@
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+
+from core import ratelimit
+from posts import feeds, follow_graph
+from posts.forms import CommentForm, PostForm
+from posts.models import Follow, Group, Post, User
+from posts.paginators import CursorPaginator
+
+from .auth import issue_token, token_user
+from .serializers import (COMMENT_FIELDS, GROUP_FIELDS, POST_FIELDS,
+                          USER_FIELDS, FieldsError, select_fields, serialize)
+
+# Потолок для ?limit= и ?ids=
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def json_response(data, status=200):
+    # Без пробелов и \u-экранирования: ответ короче и до, и после gzip
+    content = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return HttpResponse(content, status=status,
+                        content_type='application/json; charset=utf-8')
+
+
+def api_view(methods, auth=()):
+    """Обвязка JSON-обработчика.
+
+    Проверяет метод, достаёт пользователя по токену в request.api_user
+    (для методов из auth токен обязателен), считает запрос в RATE_LIMITS
+    от его имени и превращает ApiError в ответ с {"error": ...,
+    "details": ...}. CSRF не нужен: cookie API не принимает, а ответы
+    сжимаются gzip.
+    """
+    def decorator(view_func):
+        @csrf_exempt
+        @gzip_page
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise ApiError(405, 'Метод не поддерживается')
+                request.api_user = token_user(request)
+                wait = ratelimit.check(request,
+                                       request.resolver_match.view_name,
+                                       request.api_user)
+                if wait:
+                    response = json_response(
+                        {'error': 'Слишком много запросов'}, 429)
+                    response['Retry-After'] = wait
+                    return response
+                if request.method in auth and request.api_user is None:
+                    raise ApiError(401, 'Нужен токен')
+                return view_func(request, *args, **kwargs)
+            except Http404:
+                return json_response({'error': 'Не найдено'}, 404)
+            except FieldsError as error:
+                return json_response(
+                    {'error': f'Неизвестные поля: {error}'}, 400)
+            except ApiError as error:
+                return json_response(
+                    {'error': str(error), 'details': error.details},
+                    error.status)
+        # Лимит по токену считается выше, а не в RateLimitMiddleware
+        _wrapped_view.ratelimit_in_view = True
+        return _wrapped_view
+    return decorator
+
+
+def request_data(request):
+    """Тело запроса: JSON или обычная форма (для загрузки картинки)."""
+    if request.content_type != 'application/json':
+        return request.POST.dict()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError(400, 'Тело запроса — не JSON')
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Ожидается JSON-объект')
+    return data
+
+
+def int_param(request, name, default, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise ApiError(400, f'{name} должен быть числом')
+    return max(1, min(value, maximum))
+
+
+def page_response(request, paginator, available):
+    fields = select_fields(request, available)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return json_response({
+        'results': serialize(page, available, fields, request),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@api_view(['POST'])
+def token(request):
+    data = request_data(request)
+    user = authenticate(request, username=data.get('username'),
+                        password=data.get('password'))
+    if user is None:
+        raise ApiError(400, 'Неверные имя пользователя или пароль')
+    return json_response({'token': issue_token(user)}, 201)
+
+
+def posts_by_ids(request, raw_ids):
+    """Пачка постов по ?ids=1,2,3 в порядке запроса."""
+    try:
+        ids = [int(pk) for pk in raw_ids.split(',') if pk]
+    except ValueError:
+        raise ApiError(400, 'ids — список чисел через запятую')
+    if len(ids) > MAX_LIMIT:
+        raise ApiError(400, f'Не больше {MAX_LIMIT} ids за запрос')
+    found = Post.objects.select_related('author', 'group').in_bulk(ids)
+    fields = select_fields(request, POST_FIELDS)
+    return json_response({'results': serialize(
+        [found[pk] for pk in ids if pk in found],
+        POST_FIELDS, fields, request)})
+
+
+@api_view(['GET', 'POST'], auth=('POST',))
+def posts(request):
+    if request.method == 'POST':
+        return save_post(request, Post(author=request.api_user), 201)
+    if 'ids' in request.GET:
+        return posts_by_ids(request, request.GET['ids'])
+
+    queryset = Post.objects.select_related('author', 'group')
+    if 'group' in request.GET:
+        queryset = queryset.filter(group__slug=request.GET['group'])
+    if 'author' in request.GET:
+        queryset = queryset.filter(author__username=request.GET['author'])
+    limit = int_param(request, 'limit', settings.AMOUNT_OF_POSTS, MAX_LIMIT)
+    return page_response(request, CursorPaginator(queryset, limit),
+                         POST_FIELDS)
+
+
+def post_form_data(post, data):
+    """Данные для PostForm: группа приходит слагом, поля PATCH
+    дополняются текущими значениями поста."""
+    form_data = {'text': post.text, 'group': post.group_id or ''}
+    form_data.update(data)
+    slug = data.get('group')
+    if slug:
+        group = Group.objects.filter(slug=slug).first()
+        if group is None:
+            raise ApiError(400, 'Ошибка в данных',
+                           {'group': ['Нет такой группы']})
+        form_data['group'] = group.pk
+    elif 'group' in data:
+        form_data['group'] = ''
+    return form_data
+
+
+def save_post(request, post, status):
+    form = PostForm(post_form_data(post, request_data(request)),
+                    files=request.FILES or None, instance=post)
+    if not form.is_valid():
+        raise ApiError(400, 'Ошибка в данных', form.errors)
+    post = form.save()
+    return json_response(
+        serialize([post], POST_FIELDS, list(POST_FIELDS), request)[0],
+        status)
+
+
+# Картинку Django разбирает только из multipart в POST, поэтому
+# правка принимается и через POST, а не только PATCH с JSON
+@api_view(['GET', 'PATCH', 'POST'], auth=('PATCH', 'POST'))
+def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    if request.method != 'GET':
+        if post.author != request.api_user:
+            raise ApiError(403, 'Править пост может только автор')
+        return save_post(request, post, 200)
+    fields = select_fields(request, POST_FIELDS)
+    return json_response(serialize([post], POST_FIELDS, fields, request)[0])
+
+
+@api_view(['GET', 'POST'], auth=('POST',))
+def comments(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    if request.method == 'POST':
+        form = CommentForm(request_data(request))
+        if not form.is_valid():
+            raise ApiError(400, 'Ошибка в данных', form.errors)
+        comment = form.save(commit=False)
+        comment.author = request.api_user
+        comment.post = post
+        comment.save()
+        return json_response(serialize(
+            [comment], COMMENT_FIELDS, list(COMMENT_FIELDS), request)[0], 201)
+
+    limit = int_param(request, 'limit', settings.AMOUNT_OF_POSTS, MAX_LIMIT)
+    paginator = CursorPaginator(post.comments.select_related('author'),
+                                limit, ordering=('created', 'id'))
+    return page_response(request, paginator, COMMENT_FIELDS)
+
+
+@api_view(['GET'])
+def groups(request):
+    fields = select_fields(request, GROUP_FIELDS)
+    return json_response({'results': serialize(
+        Group.objects.order_by('title'), GROUP_FIELDS, fields, request)})
+
+
+@api_view(['GET'])
+def group_detail(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    fields = select_fields(request, GROUP_FIELDS)
+    return json_response(
+        serialize([group], GROUP_FIELDS, fields, request)[0])
+
+
+@api_view(['GET'])
+def user_detail(request, username):
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
+    fields = select_fields(request, USER_FIELDS)
+    return json_response(serialize([user], USER_FIELDS, fields, request)[0])
+
+
+def feed_slice(post_ids, cursor, limit):
+    """Срез ленты после поста cursor; курсор — id последнего поста."""
+    start = 0
+    if cursor:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            raise ApiError(400, 'Неверный курсор')
+        if cursor in post_ids:
+            start = post_ids.index(cursor) + 1
+        else:
+            # Пост удалён: продолжаем с более старых
+            start = len([pk for pk in post_ids if pk > cursor])
+    return post_ids[start:start + limit], start + limit < len(post_ids)
+
+
+@api_view(['GET'], auth=('GET',))
+def feed(request):
+    limit = int_param(request, 'limit', settings.AMOUNT_OF_POSTS, MAX_LIMIT)
+    page_ids, has_next = feed_slice(
+        list(feeds.get_feed_ids(request.api_user)),
+        request.GET.get('cursor'), limit)
+    found = Post.objects.select_related('author', 'group').in_bulk(page_ids)
+    fields = select_fields(request, POST_FIELDS)
+    return json_response({
+        'results': serialize([found[pk] for pk in page_ids if pk in found],
+                             POST_FIELDS, fields, request),
+        'next': str(page_ids[-1]) if has_next and page_ids else None,
+    })
+
+
+@api_view(['GET', 'POST'], auth=('GET', 'POST'))
+def follows(request):
+    if request.method == 'POST':
+        author = get_object_or_404(
+            User, username=request_data(request).get('author'))
+        if author == request.api_user:
+            raise ApiError(400, 'Нельзя подписаться на себя')
+        _, created = Follow.objects.get_or_create(
+            user=request.api_user, author=author)
+        return json_response({'author': author.username},
+                             201 if created else 200)
+    authors = User.objects.filter(
+        pk__in=follow_graph.followees(request.api_user)).order_by('username')
+    return json_response({'results': list(
+        authors.values_list('username', flat=True))})
+
+
+@api_view(['DELETE'], auth=('DELETE',))
+def unfollow(request, username):
+    Follow.objects.filter(user=request.api_user,
+                          author__username=username).delete()
+    return HttpResponse(status=204)
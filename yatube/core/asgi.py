@@ -0,0 +1,179 @@
+"""ASGI-приложение поверх WSGI-обработчика Django.
+
+В Django 2.2 нет ни async-представлений, ни ASGIHandler, поэтому
+представления остаются синхронными и выполняются в пуле из ASGI_THREADS
+потоков. Асинхронно, в цикле событий, идут только чтение тела запроса
+и отправка ответа: медленный клиент держит корутину, а не поток с
+соединением к базе. Под gunicorn с sync-воркерами тот же клиент занимал
+бы воркер целиком, пока не дошлёт форму или не дочитает страницу.
+Потоковый ответ итерируется в отдельном потоке, своём на каждый ответ.
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+# Тело запроса до мегабайта держим в памяти, больше — во временном файле
+SPOOL_MAX_SIZE = 2 ** 20
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            raise ClientDisconnected
+        body.write(message.get('body', b''))
+        if not message.get('more_body', False):
+            body.seek(0)
+            return body
+
+
+def build_environ(scope, body):
+    """WSGI environ из ASGI scope (PEP 3333: строки в latin-1)."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+def close_stream(response):
+    # close() шлёт request_finished; соединения потока ответа больше
+    # никому не нужны, и поток закрывает их сам
+    try:
+        if hasattr(response, 'close'):
+            response.close()
+    finally:
+        connections.close_all()
+
+
+class WSGIAdapter:
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(threads,
+                                           thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f'Неподдерживаемый тип scope: {scope["type"]}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await read_body(receive)
+        except ClientDisconnected:
+            return
+        loop = asyncio.get_running_loop()
+        # Свой контекст на запрос: contextvars middleware не перетекают
+        # между запросами, прошедшими через один поток пула
+        context = contextvars.Context()
+
+        def in_pool(func, *args):
+            return loop.run_in_executor(self.executor, context.run,
+                                        func, *args)
+
+        try:
+            status, headers, response = await in_pool(
+                self.call_wsgi, build_environ(scope, body))
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': headers})
+            if isinstance(response, bytes):
+                await send({'type': 'http.response.body', 'body': response})
+                return
+            await self.stream(response, context, send)
+        finally:
+            body.close()
+
+    async def stream(self, response, context, send):
+        """Отдаёт потоковый ответ (выгрузку истории) кусок за куском.
+
+        Весь ответ итерируется в одном своём потоке: генератор держит
+        курсор на соединении с базой того потока, где начал, а поток
+        пула между кусками взял бы другой запрос и мог бы закрыть это
+        соединение. Пока клиент читает кусок, поток просто ждёт
+        следующего next, а пул обслуживает остальных.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(1, thread_name_prefix='asgi-stream')
+
+        def in_thread(func, *args):
+            return loop.run_in_executor(executor, context.run, func, *args)
+
+        try:
+            chunks = iter(response)
+            while True:
+                chunk = await in_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body',
+                            'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await in_thread(close_stream, response)
+            executor.shutdown(wait=False)
+
+    def call_wsgi(self, environ):
+        """Вызывает WSGI-приложение; обычный ответ собирает в bytes."""
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        response = content = self.wsgi_application(environ, start_response)
+        if not getattr(response, 'streaming', False):
+            try:
+                content = b''.join(response)
+            finally:
+                # close() шлёт request_finished — в том же потоке, где
+                # представление открывало соединения с базой
+                if hasattr(response, 'close'):
+                    response.close()
+        status, headers = started
+        return int(status.split()[0]), [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers], content
@@ -0,0 +1,96 @@
+"""Кэш страниц с инвалидацией по поколению.
+
+Поколение — число в общем кэше, которое меняется при каждой записи
+постов, групп, комментариев и подписок. Оно входит в префикс ключа
+страницы, поэтому после записи все закэшированные страницы разом
+становятся недоступны, а старые записи просто истекают по таймауту.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+GENERATION_KEY = 'cache:generation'
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _set_generation():
+    # Метка времени, а не incr: файловый кэш не умеет атомарный инкремент,
+    # а два одновременных set всё равно дают новое, ни разу не занятое
+    # поколение.
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def bump_generation():
+    """Делает закэшированные страницы устаревшими.
+
+    Внутри транзакции поколение меняется дважды: сразу, чтобы сам
+    пишущий запрос не видел старых страниц, и после коммита. Читатель,
+    отрисовавший до коммита старое состояние, кладёт его под первое
+    новое поколение, и второй сдвиг такую запись отбрасывает — иначе
+    она жила бы PAGE_CACHE_TIMEOUT.
+    """
+    _set_generation()
+    if connection.in_atomic_block and not any(
+            func is _set_generation for _, func in connection.run_on_commit):
+        transaction.on_commit(_set_generation)
+
+
+def user_tag(request):
+    """Часть валидатора, отличающая страницы разных пользователей.
+
+    В странице залогиненного пользователя стоит CSRF-токен его форм,
+    а вход выдаёт новый. Без токена в валидаторе копия страницы из
+    прошлого входа получала бы 304, а её формы — 403.
+    """
+    if not request.user.is_authenticated:
+        return '0'
+    return f'{request.user.pk}:{request.META.get("CSRF_COOKIE", "")}'
+
+
+def generation_etag(request, *args, **kwargs):
+    """ETag страницы из кэша: поколение, пользователь и параметры."""
+    parts = (str(get_generation()), user_tag(request),
+             request.GET.urlencode())
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def generation_last_modified(request, *args, **kwargs):
+    # Поколение — это время последней записи. Last-Modified не знает
+    # о пользователе, поэтому его получают только анонимы
+    if request.user.is_authenticated:
+        return None
+    return datetime.fromtimestamp(get_generation() / 10 ** 9, timezone.utc)
+
+
+def conditional_page(etag_func, last_modified_func=None):
+    """condition() для страниц, которые браузер должен перепроверять.
+
+    Ответ помечается no-cache и Vary: Cookie: браузер каждый раз
+    присылает If-None-Match, и, пока валидатор не изменился, получает
+    304 без выборки постов и рендера шаблона.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func, last_modified_func)(
+            view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,25 @@
+"""Настройка соединений SQLite под несколько воркеров.
+
+По умолчанию SQLite пишет через журнал отката: пишущая транзакция
+запирает файл целиком, и параллельные воркеры gunicorn ловят
+«database is locked». В режиме WAL читатели не ждут писателя, а
+busy_timeout заставляет конкурентов подождать блокировку, а не падать
+сразу. journal_mode хранится в самом файле, остальные PRAGMA живут
+в соединении, поэтому выставляются на каждое новое соединение;
+CONN_MAX_AGE держит соединения открытыми между запросами.
+"""
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Обработчик connection_created: PRAGMA из settings.SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    # Сырой курсор: PRAGMA не попадают ни в бюджет запросов, ни в db
+    # из Server-Timing
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
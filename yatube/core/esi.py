@@ -0,0 +1,108 @@
+"""Общий кэш страниц с персональными вставками, в духе ESI.
+
+Страница рендерится от имени анонима: персональные места шаблона
+({% personal 'имя' аргументы %}) выводят вместо себя метку
+<!--personal:имя:аргументы-->. Такое тело одно на всех и кэшируется
+по адресу и поколению (core.cache). Перед отдачей метки заменяются
+на вставки, отрисованные для текущего пользователя: шапку, кнопку
+подписки, форму комментария. Вставки — небольшие шаблоны, и залогиненные
+пользователи получают страницу из кэша так же, как анонимы.
+
+Подделать метку текстом поста нельзя: пользовательский текст в шаблонах
+экранируется, и «<!--» превращается в «&lt;!--».
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .cache import get_generation
+from .routers import primary_reads
+
+# Имя вставки -> функция (request, *аргументы) -> HTML
+FRAGMENTS = {}
+PLACEHOLDER = re.compile(r'<!--personal:(\w+)((?::[\w.@+-]*)*)-->')
+
+
+def fragment(name):
+    """Регистрирует функцию, рисующую вставку name для пользователя."""
+    def decorator(func):
+        FRAGMENTS[name] = func
+        return func
+    return decorator
+
+
+def placeholder(name, args):
+    return ''.join([f'<!--personal:{name}',
+                    *(f':{arg}' for arg in args), '-->'])
+
+
+def is_shared_render(request):
+    """Рендерится ли сейчас общее для всех тело страницы."""
+    return getattr(request, 'shared_render', False)
+
+
+def render_fragment(request, name, args):
+    # Из метки аргументы приходят строками — так же и при рендере на месте
+    return FRAGMENTS[name](request, *map(str, args))
+
+
+def fill(request, content):
+    """Заменяет метки вставками для request.user."""
+    def replace(match):
+        name, args = match.group(1), match.group(2)
+        if name not in FRAGMENTS:
+            return match.group(0)
+        return render_fragment(request, name, args.split(':')[1:])
+    return PLACEHOLDER.sub(replace, content)
+
+
+def render_shared(view_func, request, args, kwargs):
+    """Вызывает view от имени анонима, с метками вместо вставок."""
+    user = request.user
+    request.user = AnonymousUser()
+    request.shared_render = True
+    try:
+        return view_func(request, *args, **kwargs)
+    finally:
+        request.user = user
+        request.shared_render = False
+
+
+def cache_page_shared(timeout, key_prefix):
+    """Кэш страницы, общий для анонимов и залогиненных пользователей."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'shared_page.{key_prefix}.{get_generation()}.{path}'
+            cached = cache.get(key)
+            if cached is None:
+                # Тело уходит в общий кэш — только данные с primary
+                with primary_reads():
+                    response = render_shared(view_func, request, args,
+                                             kwargs)
+                if response.streaming:
+                    return response
+                cached = (response.content.decode(response.charset),
+                          response['Content-Type'])
+                if response.status_code != 200:
+                    response.content = fill(request, cached[0])
+                    return response
+                cache.set(key, cached, timeout)
+            content, content_type = cached
+            return HttpResponse(fill(request, content),
+                                content_type=content_type)
+        return _wrapped_view
+    return decorator
+
+
+@fragment('header')
+def header(request):
+    return render_to_string('includes/header.html', request=request)
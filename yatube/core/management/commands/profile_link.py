@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.middleware import PROFILE_PARAM, profile_token
+
+
+class Command(BaseCommand):
+    help = 'Печатает ссылку, по которой запрос пойдёт под профилировщиком.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь страницы, например /follow/')
+
+    def handle(self, *args, **options):
+        path, _, query = options['path'].partition('?')
+        query += '&' if query else ''
+        self.stdout.write(
+            f'{path}?{query}{PROFILE_PARAM}={profile_token(path)}')
@@ -0,0 +1,214 @@
+import cProfile
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from . import ratelimit
+from .routers import close_route, current_route, open_route
+from .timing import collect, db_wrapper, timing
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PARAM = '_profile'
+PROFILE_SALT = 'core.middleware.profile'
+
+
+class QueryBudgetExceeded(Exception):
+    """Страница сделала больше SQL-запросов, чем ей разрешено."""
+
+
+class QueryCounter:
+    """execute_wrapper, считающий запросы ко всем базам."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Следит, чтобы число запросов страницы не росло (N+1).
+
+    Бюджеты задаются в QUERY_BUDGETS по имени URL ('posts:index': 6).
+    Превышение пишется в лог, а при QUERY_BUDGET_RAISE поднимает
+    QueryBudgetExceeded — так регрессия ловится тестами.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        budget = match and settings.QUERY_BUDGETS.get(match.view_name)
+        if budget is not None and counter.count > budget:
+            message = (f'{match.view_name}: {counter.count} SQL-запросов '
+                       f'при бюджете {budget}')
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def profile_token(path):
+    """Подписанное значение PROFILE_PARAM, включающее профилировщик."""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign(path)
+
+
+def _wants_profile(request):
+    if random.random() < settings.PROFILE_SAMPLE_RATE:
+        return True
+    token = request.GET.get(PROFILE_PARAM)
+    if not token:
+        return False
+    try:
+        path = signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return path == request.path
+
+
+class ServerTimingMiddleware:
+    """Разбивает время запроса по этапам.
+
+    url — разбор адреса, view — обработчик вместе с рендером ответа,
+    db, tpl и cache — время ORM, шаблонов и кэша внутри него (core.timing).
+    Замеры уходят в заголовок Server-Timing (при SERVER_TIMING) и в лог
+    одной строкой key=value.
+
+    Доля PROFILE_SAMPLE_RATE запросов, а также запросы с подписанным
+    параметром _profile (profile_token, команда profile_link) идут
+    под cProfile; статистика сохраняется в PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(db_wrapper))
+            with timing('url'):
+                try:
+                    resolve(request.path_info)
+                except Resolver404:
+                    pass
+            profiler = cProfile.Profile() if _wants_profile(request) else None
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+            view_started = getattr(request, '_view_started', None)
+            if view_started is not None:
+                timings.add('view',
+                            (time.perf_counter() - view_started) * 1000)
+            timings.add('total', (time.perf_counter() - start) * 1000)
+
+        header = timings.header()
+        if profiler:
+            name = self.save_profile(profiler, request)
+            header += f', prof;desc="{name}"'
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = header
+        logger.info(
+            'method=%s path=%s status=%s %s', request.method, request.path,
+            response.status_code,
+            ' '.join(f'{key}={value}'
+                     for key, value in timings.as_dict().items()),
+            extra={'timings': timings.as_dict()})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_started = time.perf_counter()
+
+    def save_profile(self, profiler, request):
+        match = request.resolver_match
+        view = match.view_name.replace(':', '.') if match else 'unknown'
+        name = f'{time.time_ns()}-{view}.prof'
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+        return name
+
+
+class ReplicaMiddleware:
+    """Открывает маршрут чтения (core.routers) на время запроса.
+
+    Страницы из REPLICA_VIEWS читают с реплик, если пользователь не писал
+    последние REPLICA_STICKY_SECONDS секунд. После записи в ответ ставится
+    cookie REPLICA_STICKY_COOKIE со сроком окончания липкости.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = open_route(self.is_sticky(request))
+        try:
+            response = self.get_response(request)
+            route = current_route()
+        finally:
+            close_route(token)
+        if route.wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE,
+                                str(int(time.time()) + seconds),
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def is_sticky(self, request):
+        try:
+            until = int(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE))
+        except (TypeError, ValueError):
+            return False
+        return until > time.time()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if (request.method in ('GET', 'HEAD')
+                and match.view_name in settings.REPLICA_VIEWS):
+            current_route().allow_replica()
+
+
+class RateLimitMiddleware:
+    """Отвечает 429 с Retry-After, если страница из RATE_LIMITS вызвана
+    чаще, чем позволяет ведро пользователя или IP (core.ratelimit).
+
+    Представления с ratelimit_in_view (API по токену) проверяют лимит
+    сами: пользователь у них известен только внутри представления.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'ratelimit_in_view', False):
+            return None
+        wait = ratelimit.check(request, request.resolver_match.view_name)
+        if wait:
+            response = HttpResponse('Слишком много запросов', status=429)
+            response['Retry-After'] = wait
+            return response
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ведро')),
+                ('tat', models.BigIntegerField(default=0, verbose_name='TAT, мс')),
+            ],
+        ),
+    ]
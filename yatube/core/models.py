@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class RateBucket(models.Model):
+    """Ведро ограничения частоты (core.ratelimit): его TAT в мс."""
+    key = models.CharField(
+        verbose_name='Ведро',
+        max_length=255,
+        unique=True,
+    )
+    tat = models.BigIntegerField(
+        verbose_name='TAT, мс',
+        default=0,
+    )
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,121 @@
+"""Ограничение частоты записей: token bucket на пользователя и на IP.
+
+Ведро из RATE_LIMITS — строка RateBucket с одним числом, TAT (GCRA):
+момент в миллисекундах, когда ведро снова станет полным. Токены берутся
+одним UPDATE с F(): TAT сдвигается на их интервал, только если не уйдёт
+дальше ёмкости ведра, поэтому одновременные запросы не проходят сверх
+лимита. Простаивающее ведро подтягивается к текущему времени (Greatest).
+В общем кэше ведро не держим: файловый кэш не умеет атомарный incr,
+а каждая его запись ещё и сверяет число файлов.
+
+Процесс забирает из ведра сразу RESERVE_SHARE его ёмкости (не меньше
+токена) и тратит запас из словаря в памяти: разрешённые запросы чаще
+всего не трогают базу. Запас действует, пока взятые токены не вернулись
+бы в ведро сами, так что всплеск сверх ёмкости не больше запаса.
+Кто уже получил отказ, до конца Retry-After отсекается по такому же
+словарю: бот, долбящий форму, обходится лимитеру в поиск по dict.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import RateBucket
+
+# Доля ёмкости ведра, которую процесс берёт за один запрос к базе
+RESERVE_SHARE = 0.1
+
+# (имя URL, вид ведра, идентификатор) -> time.time(), до которого отказ
+_blocked = {}
+# Ключ ведра -> [токенов в запасе, мс до которой запас действует]
+_reserved = {}
+_reserved_lock = threading.Lock()
+# Больше стольких записей словарь просто очищается
+BLOCKED_MAX_ENTRIES = 10000
+
+
+def identities(request, limits, user):
+    """(вид ведра, идентификатор, ёмкость, секунд на полное ведро)."""
+    if 'user' in limits and user is not None and user.is_authenticated:
+        yield ('user', str(user.pk), *limits['user'])
+    if 'ip' in limits:
+        yield ('ip', request.META.get('REMOTE_ADDR', ''), *limits['ip'])
+
+
+def _buckets():
+    # Мимо роутера: чтение лимита не делает запрос «пишущим»
+    return RateBucket.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _take_tokens(key, tokens, capacity, interval, now_ms):
+    """Забирает из ведра tokens токенов разом; False, если их нет."""
+    taken = _buckets().filter(
+        key=key, tat__lte=now_ms + (capacity - tokens) * interval
+    ).update(tat=Greatest(F('tat'), Value(now_ms)) + tokens * interval)
+    if taken:
+        return True
+    if _buckets().filter(key=key).exists():
+        return False
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            _buckets().create(key=key, tat=now_ms + tokens * interval)
+        return True
+    except IntegrityError:
+        # Ведро только что создал параллельный запрос
+        return _take_tokens(key, tokens, capacity, interval, now_ms)
+
+
+def _from_reserve(key, now_ms):
+    with _reserved_lock:
+        reserve = _reserved.get(key)
+        if reserve and reserve[0] > 0 and reserve[1] > now_ms:
+            reserve[0] -= 1
+            return True
+    return False
+
+
+def take(key, capacity, period, now_ms):
+    """Берёт токен; возвращает 0 или сколько мс ждать следующего."""
+    if _from_reserve(key, now_ms):
+        return 0
+    interval = max(period * 1000 // capacity, 1)
+    reserve = max(int(capacity * RESERVE_SHARE), 1)
+    # Полного запаса может не остаться — тогда хотя бы один токен
+    for tokens in dict.fromkeys([reserve, 1]):
+        if _take_tokens(key, tokens, capacity, interval, now_ms):
+            with _reserved_lock:
+                if len(_reserved) >= BLOCKED_MAX_ENTRIES:
+                    _reserved.clear()
+                _reserved[key] = [tokens - 1, now_ms + tokens * interval]
+            return 0
+    tat = _buckets().filter(key=key).values_list('tat', flat=True).first()
+    return max(tat + interval - now_ms - capacity * interval, 1)
+
+
+def check(request, view_name, user=None):
+    """Секунд до следующей разрешённой записи или 0, если можно сейчас.
+
+    user — автор записи, если он не request.user (токен API).
+    """
+    limits = settings.RATE_LIMITS.get(view_name)
+    if not limits or request.method not in limits.get('methods', ['POST']):
+        return 0
+    now = time.time()
+    for kind, ident, capacity, period in identities(
+            request, limits, user or request.user):
+        blocked_key = (view_name, kind, ident)
+        until = _blocked.get(blocked_key, 0)
+        if until > now:
+            return math.ceil(until - now)
+        wait_ms = take(f'ratelimit:{view_name}:{kind}:{ident}', capacity,
+                       period, int(now * 1000))
+        if wait_ms:
+            if len(_blocked) >= BLOCKED_MAX_ENTRIES:
+                _blocked.clear()
+            _blocked[blocked_key] = now + wait_ms / 1000
+            return math.ceil(wait_ms / 1000)
+    return 0
@@ -0,0 +1,146 @@
+"""Чтение лент и постов с реплик.
+
+ReplicaMiddleware открывает на время запроса маршрут (contextvar).
+Если имя URL есть в REPLICA_VIEWS, чтения моделей из REPLICA_APPS
+уходят на одну из здоровых реплик REPLICA_DATABASES, остальное — на
+default. Вне запросов (команды, воркеры) всё читается с default.
+
+Любая запись переводит запрос на default и ставит cookie липкости:
+следующие REPLICA_STICKY_SECONDS секунд пользователь читает с primary
+и видит свои посты, комментарии и подписки, даже если реплика отстала.
+
+То, что кладётся в общий кэш (тела страниц, счётчики, ленты, граф
+подписок), читается только с primary — в блоке primary_reads() или
+через .using(DEFAULT_DB_ALIAS). Иначе отставшая реплика попала бы
+в кэш под новым поколением и держалась бы там до его истечения.
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .timing import current
+
+logger = logging.getLogger(__name__)
+
+_route = ContextVar('replica_route', default=None)
+# Псевдоним реплики -> (здорова ли, когда проверяли)
+_health = {}
+
+
+def is_healthy(alias):
+    """Проверка реплики не чаще раза в REPLICA_HEALTH_INTERVAL."""
+    healthy, checked = _health.get(alias, (True, None))
+    now = time.monotonic()
+    if (checked is not None
+            and now - checked < settings.REPLICA_HEALTH_INTERVAL):
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        healthy = True
+    except DatabaseError as error:
+        logger.warning('Реплика %s исключена: %s', alias, error)
+        connections[alias].close()
+        healthy = False
+    _health[alias] = (healthy, now)
+    return healthy
+
+
+class Route:
+    """Куда идут чтения текущего запроса.
+
+    reason попадает в лог запроса: replica, sticky (недавно писал),
+    write (писал в этом запросе), fallback (реплики недоступны) или
+    primary (страница не читает с реплик).
+    """
+
+    def __init__(self, sticky):
+        self.sticky = sticky
+        self.wrote = False
+        self.replica_allowed = False
+        self._alias = None
+        self._set_reason('primary')
+
+    def _set_reason(self, reason):
+        self.reason = reason
+        timings = current()
+        if timings is not None:
+            timings.db_route = reason
+
+    def allow_replica(self):
+        if self.sticky:
+            self._set_reason('sticky')
+        else:
+            self.replica_allowed = True
+
+    def mark_write(self):
+        if not self.wrote:
+            self.wrote = True
+            self._set_reason('write')
+
+    def read_alias(self):
+        if not self.replica_allowed or self.wrote:
+            return DEFAULT_DB_ALIAS
+        if self._alias is None:
+            # Одна реплика на весь запрос: страница видит один снимок
+            healthy = [alias for alias in settings.REPLICA_DATABASES
+                       if is_healthy(alias)]
+            self._alias = random.choice(healthy) if healthy else (
+                DEFAULT_DB_ALIAS)
+            self._set_reason('replica' if healthy else 'fallback')
+        return self._alias
+
+
+def current_route():
+    return _route.get()
+
+
+@contextmanager
+def primary_reads():
+    """Внутри блока чтения текущего запроса идут на default."""
+    route = _route.get()
+    if route is None or not route.replica_allowed:
+        yield
+        return
+    route.replica_allowed = False
+    try:
+        yield
+    finally:
+        route.replica_allowed = True
+
+
+def open_route(sticky):
+    return _route.set(Route(sticky))
+
+
+def close_route(token):
+    _route.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if (route is None
+                or model._meta.app_label not in settings.REPLICA_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return route.read_alias()
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.mark_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что на primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема реплик приезжает вместе с копией базы
+        return db == DEFAULT_DB_ALIAS
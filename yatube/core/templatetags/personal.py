@@ -0,0 +1,15 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.esi import is_shared_render, placeholder, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def personal(context, name, *args):
+    """Персональная вставка; в общем кэше страницы — её метка."""
+    request = context['request']
+    if is_shared_render(request):
+        return mark_safe(placeholder(name, args))
+    return mark_safe(render_fragment(request, name, args))
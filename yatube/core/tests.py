@@ -1,6 +1,31 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import ratelimit, routers
+from core.cache import get_generation
+from core.asgi import WSGIAdapter
+from core.middleware import PROFILE_PARAM, profile_token
+from core.timing import FileBasedCache
+from posts.models import Post
+
+TEMP_PROFILE_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class ViewTestClass(TestCase):
@@ -10,3 +35,352 @@ class ViewTestClass(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.Not_Found)
         # Проверьте, что используется шаблон core/404.html
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(SERVER_TIMING=True, PROFILE_DIR=TEMP_PROFILE_DIR)
+class ServerTimingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_header_has_request_stages(self):
+        response = self.client.get('/')
+        header = response['Server-Timing']
+        for metric in ('url;dur=', 'view;dur=', 'db;dur=', 'tpl;dur=',
+                       'cache;dur=', 'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, header)
+
+        # Повтор отдаётся из кэша страниц без промахов; из шаблонов
+        # рисуются только персональные вставки (core.esi)
+        response = self.client.get('/')
+        self.assertIn('0 misses', response['Server-Timing'])
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertTemplateUsed(response, 'includes/header.html')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_is_off(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+    def test_signed_parameter_enables_profiler(self):
+        with self.assertLogs('core.middleware', 'INFO'):
+            self.client.get('/', {PROFILE_PARAM: 'bad:signature'})
+        self.assertFalse(os.listdir(TEMP_PROFILE_DIR))
+
+        response = self.client.get('/', {PROFILE_PARAM: profile_token('/')})
+        self.assertIn('prof;desc=', response['Server-Timing'])
+        self.assertEqual(len(os.listdir(TEMP_PROFILE_DIR)), 1)
+
+
+class GenerationTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='author')
+
+    def test_generation_moves_again_after_commit(self):
+        """Страница, отрисованная до коммита, не переживает коммит."""
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Пост')
+            before_commit = get_generation()
+        self.assertNotEqual(get_generation(), before_commit)
+
+
+class FileCacheCullTest(SimpleTestCase):
+    def test_directory_is_listed_once_per_interval(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        file_cache = FileBasedCache(location, {
+            'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_INTERVAL': 60}})
+        with mock.patch.object(file_cache, '_list_cache_files',
+                               wraps=file_cache._list_cache_files) as listed:
+            for number in range(5):
+                file_cache.set(f'key{number}', number)
+        self.assertEqual(listed.call_count, 1)
+
+
+class SqlitePragmasTest(TestCase):
+    def test_new_connection_gets_pragmas(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        connection = DatabaseWrapper(dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(workdir, 'db.sqlite3')))
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        # synchronous=NORMAL — это 1
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1,
+                                  'busy_timeout': 5000})
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    # Зеркало видит данные default только после коммита, поэтому без
+    # обёртки TestCase в транзакцию
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        routers._health.clear()
+        self.user = get_user_model().objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+
+    def queries(self, url, method='get', data=None):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            getattr(self.client, method)(url, data)
+        return len(primary), len(replica)
+
+    def test_feed_reads_go_to_replica(self):
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            primary, replica = self.queries(reverse('posts:search'),
+                                            data={'q': 'пост'})
+        self.assertTrue(replica)
+        self.assertIn('db_route=replica', logs.output[0])
+        self.assertIn(f'queries_replica={replica}', logs.output[0])
+        # Создание поста и прочие страницы вне REPLICA_VIEWS — на primary
+        self.client.force_login(self.user)
+        _, replica = self.queries(reverse('posts:post_create'))
+        self.assertEqual(replica, 0)
+
+    def test_shared_caches_are_built_from_primary(self):
+        """Что уходит в общий кэш, читается с primary, а не с реплики."""
+        Post.objects.create(author=self.user, text='Свежий пост')
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'reader'}),
+            reverse('posts:index') + '?cursor=',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                primary, replica = self.queries(url)
+                self.assertTrue(primary)
+                self.assertEqual(replica, 0)
+        self.assertTrue(cache.get(f'shared_page.index_page.'
+                                  f'{get_generation()}.'
+                                  f'{hashlib.md5(b"/").hexdigest()}'))
+        # Страница из кэша уже с новым постом
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            'Свежий пост')
+
+    def test_writer_sticks_to_primary(self):
+        self.client.force_login(self.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.queries(reverse('posts:add_comment',
+                             kwargs={'post_id': self.post.pk}),
+                     'post', {'text': 'Коммент'})
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, self.client.cookies)
+        primary, replica = self.queries(url)
+        self.assertEqual(replica, 0)
+        self.assertTrue(primary)
+
+        del self.client.cookies[settings.REPLICA_STICKY_COOKIE]
+        _, replica = self.queries(url)
+        self.assertTrue(replica)
+
+    def test_unhealthy_replica_is_excluded(self):
+        with mock.patch.object(connections['replica'], 'cursor',
+                               side_effect=DatabaseError('нет связи')):
+            with self.assertLogs('core.routers', 'WARNING'):
+                _, replica = self.queries(reverse('posts:search'),
+                                          data={'q': 'пост'})
+        self.assertEqual(replica, 0)
+        # Исключение запоминается до следующей проверки
+        _, replica = self.queries(reverse('posts:search'),
+                                  data={'q': 'другой'})
+        self.assertEqual(replica, 0)
+
+
+def asgi_call(application, path, method='GET', body_parts=(b'',),
+              headers=()):
+    """Прогоняет один запрос через ASGI-приложение: (статус, сообщения)."""
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method,
+             'path': path, 'query_string': query.encode(),
+             'headers': list(headers), 'client': ('10.0.0.1', 5000),
+             'server': ('testserver', 80)}
+    incoming = [{'type': 'http.request', 'body': part,
+                 'more_body': i < len(body_parts) - 1}
+                for i, part in enumerate(body_parts)]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return sent[0]['status'], sent
+
+
+class ASGIAdapterTest(SimpleTestCase):
+    def test_request_reaches_wsgi_environ(self):
+        def echo(environ, start_response):
+            start_response('201 Created', [('X-Method',
+                                            environ['REQUEST_METHOD'])])
+            return [environ['wsgi.input'].read(), b'|',
+                    environ['QUERY_STRING'].encode(), b'|',
+                    environ['HTTP_X_TOKEN'].encode(), b'|',
+                    environ['CONTENT_TYPE'].encode(), b'|',
+                    environ['REMOTE_ADDR'].encode()]
+
+        status, sent = asgi_call(
+            WSGIAdapter(echo, 1), '/x/?a=1', 'POST', (b'ab', b'cd'),
+            [(b'x-token', b'1'), (b'x-token', b'2'),
+             (b'content-type', b'text/plain')])
+        self.assertEqual(status, 201)
+        self.assertIn((b'x-method', b'POST'), sent[0]['headers'])
+        self.assertEqual(sent[1]['body'],
+                         b'abcd|a=1|1,2|text/plain|10.0.0.1')
+
+    def test_streaming_response_is_sent_by_chunks(self):
+        closed = []
+
+        class Streaming(list):
+            streaming = True
+
+            def close(self):
+                closed.append(True)
+
+        def stream(environ, start_response):
+            start_response('200 OK', [])
+            return Streaming([b'one', b'two'])
+
+        _, sent = asgi_call(WSGIAdapter(stream, 1), '/')
+        self.assertEqual([message.get('body') for message in sent[1:]],
+                         [b'one', b'two', None])
+        self.assertTrue(sent[1]['more_body'])
+        self.assertEqual(closed, [True])
+
+    def test_streaming_response_stays_on_one_thread(self):
+        threads = []
+
+        class Streaming:
+            streaming = True
+
+            def __iter__(self):
+                for _ in range(20):
+                    threads.append(threading.current_thread().name)
+                    yield b'chunk'
+
+            def close(self):
+                threads.append(threading.current_thread().name)
+
+        def stream(environ, start_response):
+            start_response('200 OK', [])
+            return Streaming()
+
+        asgi_call(WSGIAdapter(stream, 4), '/')
+        self.assertEqual(len(threads), 21)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertTrue(threads[0].startswith('asgi-stream'))
+
+    def test_django_page(self):
+        application = WSGIAdapter(get_wsgi_application(), 2)
+        status, sent = asgi_call(application, reverse('about:author'))
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertIn('Об авторе'.encode(), sent[1]['body'])
+
+
+@override_settings(RATE_LIMITS={
+    'posts:add_comment': {'user': (2, 60), 'ip': (3, 60)},
+    'users:signup': {'ip': (1, 60)},
+})
+class RateLimitTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        ratelimit._blocked.clear()
+        ratelimit._reserved.clear()
+        self.url = reverse('posts:add_comment',
+                           kwargs={'post_id': self.post.pk})
+        self.now = 1_000_000.0
+        patcher = mock.patch('core.ratelimit.time.time',
+                             lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def comment(self, user):
+        self.client.force_login(user)
+        return self.client.post(self.url, {'text': 'Спам'})
+
+    def test_user_bucket(self):
+        for _ in range(2):
+            self.assertEqual(self.comment(self.author).status_code,
+                             HTTPStatus.FOUND)
+        response = self.comment(self.author)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.post.comments.count(), 2)
+
+        # Через интервал одного токена ведро отдаёт ещё одну запись
+        self.now += 30
+        self.assertEqual(self.comment(self.author).status_code,
+                         HTTPStatus.FOUND)
+        self.assertEqual(self.comment(self.author).status_code,
+                         HTTPStatus.TOO_MANY_REQUESTS)
+
+    def test_ip_bucket_is_shared_by_users(self):
+        self.comment(self.author)
+        self.comment(self.author)
+        self.assertEqual(self.comment(self.other).status_code,
+                         HTTPStatus.FOUND)
+        self.assertEqual(self.comment(self.other).status_code,
+                         HTTPStatus.TOO_MANY_REQUESTS)
+
+    def bucket_queries(self, user):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.comment(user)
+        return response, [query for query in queries.captured_queries
+                          if 'core_ratebucket' in query['sql']]
+
+    def test_blocked_client_does_not_touch_buckets(self):
+        for _ in range(3):
+            self.comment(self.author)
+        response, queries = self.bucket_queries(self.author)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(queries, [])
+
+    @override_settings(RATE_LIMITS={'posts:add_comment': {'user': (20, 60)}})
+    def test_allowed_requests_spend_process_reserve(self):
+        """Процесс берёт токены пачкой, но не сверх ёмкости ведра."""
+        response, queries = self.bucket_queries(self.author)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertTrue(queries)
+        # Запас — 10% ёмкости, второй токен из памяти процесса
+        response, queries = self.bucket_queries(self.author)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(queries, [])
+        for _ in range(18):
+            self.assertEqual(self.comment(self.author).status_code,
+                             HTTPStatus.FOUND)
+        self.assertEqual(self.comment(self.author).status_code,
+                         HTTPStatus.TOO_MANY_REQUESTS)
+        # Запас другого процесса тоже берётся из общего ведра
+        ratelimit._reserved.clear()
+        ratelimit._blocked.clear()
+        self.assertEqual(self.comment(self.author).status_code,
+                         HTTPStatus.TOO_MANY_REQUESTS)
+
+    def test_anonymous_signup_limited_by_ip(self):
+        url = reverse('users:signup')
+        self.assertEqual(self.client.get(url).status_code, HTTPStatus.OK)
+        self.assertEqual(self.client.get(url).status_code, HTTPStatus.OK)
+        self.client.post(url, {})
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
@@ -0,0 +1,176 @@
+"""Разбивка времени запроса по этапам для заголовка Server-Timing.
+
+ServerTimingMiddleware кладёт в contextvar сборщик RequestTimings,
+а ORM, шаблоны и кэш дописывают в него своё время. Вне запроса
+сборщика нет, и замеры ничего не стоят.
+
+Шаблоны и кэш меряются через свои бэкенды из этого модуля: они
+подключаются в TEMPLATES и CACHES вместо стандартных.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache.backends.filebased import \
+    FileBasedCache as BaseFileBasedCache
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.template.backends.django import DjangoTemplates, Template
+
+_current = ContextVar('request_timings', default=None)
+_MISSING = object()
+
+
+class RequestTimings:
+    """Накопленные за запрос длительности (мс) и счётчики."""
+
+    def __init__(self):
+        self.durations = {}
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Запросы по базам и причина выбора базы (core.routers)
+        self.db_queries = {}
+        self.db_route = None
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0) + duration
+
+    def header(self):
+        """Значение заголовка Server-Timing."""
+        descriptions = {
+            'db': f'{self.queries} queries',
+            'cache': f'{self.cache_hits} hits, {self.cache_misses} misses',
+        }
+        metrics = []
+        for name, duration in self.durations.items():
+            metric = f'{name};dur={duration:.2f}'
+            if name in descriptions:
+                metric += f';desc="{descriptions[name]}"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        data = {f'{name}_ms': round(duration, 2)
+                for name, duration in self.durations.items()}
+        data.update(queries=self.queries, cache_hits=self.cache_hits,
+                    cache_misses=self.cache_misses)
+        if self.db_route:
+            data['db_route'] = self.db_route
+        # Одна база — как раньше; с репликами видно, куда ушли запросы
+        if len(self.db_queries) > 1 or self.db_route:
+            data.update((f'queries_{alias}', count)
+                        for alias, count in self.db_queries.items())
+        return data
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Включает сбор замеров на время запроса."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timing(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper: время и число SQL-запросов."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.queries += 1
+    alias = context['connection'].alias
+    timings.db_queries[alias] = timings.db_queries.get(alias, 0) + 1
+    with timing('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timing('tpl'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который меряет рендер шаблонов страницы.
+
+    Включённые через {% include %} шаблоны рендерятся внутри внешнего
+    и отдельно не считаются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self)
+
+
+class TimedCacheMixin:
+    """Время обращений к кэшу и число попаданий и промахов.
+
+    Файловый и локальный кэши собирают get_many из get, поэтому
+    отдельно его мерить не нужно.
+    """
+
+    def get(self, key, default=None, version=None):
+        with timing('cache'):
+            value = super().get(key, _MISSING, version)
+        self._record(hits=int(value is not _MISSING),
+                     misses=int(value is _MISSING))
+        return default if value is _MISSING else value
+
+    def set(self, *args, **kwargs):
+        with timing('cache'):
+            return super().set(*args, **kwargs)
+
+    def _record(self, hits, misses):
+        timings = _current.get()
+        if timings is not None:
+            timings.cache_hits += hits
+            timings.cache_misses += misses
+
+
+class FileBasedCache(TimedCacheMixin, BaseFileBasedCache):
+    """Файловый кэш, который не листает каталог на каждой записи.
+
+    Django сверяет число файлов с MAX_ENTRIES в каждом set, читая весь
+    каталог кэша. Здесь это делается не чаще раза в CULL_INTERVAL
+    секунд на процесс, и запись стоит одинаково при любом числе файлов.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get(
+            'CULL_INTERVAL', 10)
+        self._next_cull = 0
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        super()._cull()
+
+
+class LocMemCache(TimedCacheMixin, BaseLocMemCache):
+    pass
@@ -1,6 +1,10 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import search_posts
+
+# Сколько лучших совпадений поиска показывать в админке
+ADMIN_SEARCH_LIMIT = 1000
 
 
 @admin.register(Post)
@@ -11,5 +15,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%q%' по всей таблице — выборка из поискового индекса
+        if not search_term:
+            return queryset, False
+        ids = search_posts(search_term).ids(0, ADMIN_SEARCH_LIMIT)
+        return queryset.filter(pk__in=ids), False
+
 
 admin.site.register(Group)
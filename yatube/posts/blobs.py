@@ -0,0 +1,75 @@
+"""Счётчики ссылок постов на файлы картинок (MediaBlob).
+
+Файл хранилища posts.storage общий для всех постов с той же картинкой,
+поэтому удалять его можно только вместе с последним постом. Счётчик
+меняется сигналами Post; после bulk_create (import_posts) его
+пересобирает recount().
+
+acquire и release меняют строку одной транзакцией, а последняя ссылка
+удаляет строку условным DELETE, без промежуточного refs=0, которое
+успел бы увеличить параллельный acquire. Загрузка того же файла до
+её acquire видна только по отметке хранилища (storage.save), поэтому
+delete_file проверяет и MediaBlob, и отметку под блокировкой хранилища.
+"""
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaBlob, Post, ThumbnailTask
+from .storage import image_storage
+
+
+def acquire(name):
+    if not name:
+        return
+    with transaction.atomic():
+        updated = MediaBlob.objects.filter(name=name).update(
+            refs=F('refs') + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, refs=1)
+            except IntegrityError:
+                # Строку только что создал параллельный acquire
+                MediaBlob.objects.filter(name=name).update(
+                    refs=F('refs') + 1)
+
+
+def release(name):
+    """Минус ссылка; файл без ссылок удаляется после коммита."""
+    if not name:
+        return
+    with transaction.atomic():
+        deleted, _ = MediaBlob.objects.filter(
+            name=name, refs__lte=1).delete()
+        if not deleted:
+            MediaBlob.objects.filter(name=name).update(refs=F('refs') - 1)
+    if deleted:
+        transaction.on_commit(lambda: delete_file(name))
+
+
+def delete_file(name):
+    """Удаляет файл с миниатюрами, если его не взяли снова."""
+    with image_storage.locked():
+        if (MediaBlob.objects.filter(name=name).exists()
+                or image_storage.reused_recently(name)):
+            return
+        ThumbnailTask.objects.filter(image=name).delete()
+        default.kvstore.delete_thumbnails(ImageFile(name, image_storage))
+        try:
+            image_storage.delete(name)
+        except SuspiciousFileOperation:
+            # Путь вне MEDIA_ROOT, записанный в обход формы, — файл не наш
+            pass
+
+
+def recount():
+    """Пересчитывает ссылки по постам с нуля."""
+    refs = Post.objects.exclude(image='').values_list('image').annotate(
+        refs=Count('pk')).order_by()
+    with transaction.atomic():
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.bulk_create(
+            MediaBlob(name=name, refs=count) for name, count in refs)
@@ -0,0 +1,47 @@
+"""Кэш отрендеренных карточек постов (includes/post_card.html).
+
+Ключ карточки — id поста и его поле updated, поэтому правка поста
+сама делает старую карточку недоступной. Правки группы и автора
+меняют updated их постов (touch_posts, см. signals). Карточки страницы
+достаются из кэша одним get_many, рендерятся только недостающие.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .thumbnails import rendition_names, warm_renditions
+
+TEMPLATE = 'includes/post_card.html'
+
+
+def card_key(post, author, group):
+    # На страницах автора и группы в карточке нет ссылок на них же
+    variant = f'{int(bool(author))}{int(bool(group))}'
+    version = int(post.updated.timestamp() * 1000000)
+    return f'post_card:{variant}:{post.pk}:{version}'
+
+
+def render_cards(posts, author=None, group=None):
+    """HTML карточек posts в том же порядке."""
+    keys = [card_key(post, author, group) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [(key, post) for key, post in zip(keys, posts)
+               if key not in cards]
+    if missing:
+        warm_renditions([post.image for _, post in missing],
+                        rendition_names('card'))
+        rendered = {
+            key: render_to_string(TEMPLATE, {
+                'post': post, 'author': author, 'group': group})
+            for key, post in missing
+        }
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+def touch_posts(posts):
+    """Сдвигает версию карточек постов из queryset posts."""
+    posts.update(updated=timezone.now())
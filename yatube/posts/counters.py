@@ -0,0 +1,57 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарно через F-выражения в сигналах (posts.signals).
+Массовые операции в обход сигналов (bulk_create, queryset.update) их
+не трогают — разошедшиеся значения чинит команда recount.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        # Не уводим счётчик ниже нуля, если он уже разошёлся с данными
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user_counter(user_id, field, delta):
+    stats = UserStats.objects.filter(user_id=user_id)
+    if not _change(stats, field, delta) and delta > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        _change(stats, field, delta)
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post_comments(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count_of(queryset, field, outer='pk'):
+    """Подзапрос «число строк queryset на объект» для UPDATE."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(outer)})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount():
+    """Пересчитывает все счётчики по фактическим данным."""
+    UserStats.objects.bulk_create(
+        UserStats(user_id=user_id) for user_id in
+        User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+    )
+    Group.objects.update(posts_count=_count_of(Post.objects, 'group'))
+    Post.objects.update(comments_count=_count_of(Comment.objects, 'post'))
+    UserStats.objects.update(
+        posts_count=_count_of(Post.objects, 'author', 'user'),
+        followers_count=_count_of(Follow.objects, 'author', 'user'),
+        following_count=_count_of(Follow.objects, 'user', 'user'),
+    )
@@ -0,0 +1,104 @@
+"""Выгрузка истории автора: его посты и комментарии.
+
+Строки читаются через iterator(chunk_size), то есть курсором базы
+пачками, и сразу уходят в StreamingHttpResponse, поэтому память
+не растёт с размером истории. ZIP тоже собирается на лету: zipfile
+умеет писать в поток без seek, ставя размеры после каждого файла.
+"""
+import csv
+import json
+import zipfile
+
+from .models import Comment, Post
+from .storage import image_storage
+from .transfer import dump_value
+
+CHUNK_SIZE = 2000
+
+# Имена колонок выгрузки и поля модели для values_list
+POST_COLUMNS = (('id', 'id'), ('created', 'pub_date'),
+                ('group', 'group__slug'), ('text', 'text'),
+                ('image', 'image'))
+COMMENT_COLUMNS = (('id', 'id'), ('created', 'created'),
+                   ('post', 'post_id'), ('text', 'text'))
+CSV_COLUMNS = ('type', 'id', 'created', 'post', 'group', 'text', 'image')
+
+
+def history_records(user):
+    """(тип, запись) по всем постам автора, затем по комментариям."""
+    sources = (
+        ('post', Post.objects.filter(author=user), POST_COLUMNS),
+        ('comment', Comment.objects.filter(author=user), COMMENT_COLUMNS),
+    )
+    for kind, queryset, columns in sources:
+        rows = queryset.order_by('pk').values_list(
+            *(field for _, field in columns))
+        names = [name for name, _ in columns]
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield kind, dict(zip(names, map(dump_value, row)))
+
+
+def ndjson_lines(records):
+    for kind, record in records:
+        line = {'type': kind}
+        line.update(record)
+        yield json.dumps(line, ensure_ascii=False,
+                         separators=(',', ':')) + '\n'
+
+
+class Echo:
+    """Файл, который возвращает записанное, а не хранит его."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    writer = csv.DictWriter(Echo(), CSV_COLUMNS, restval='')
+    yield writer.writeheader()
+    for kind, record in records:
+        record['type'] = kind
+        yield writer.writerow(record)
+
+
+class ZipStream:
+    """Буфер, который отдаёт накопленные байты и сразу их забывает."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_chunks(user, lines, name):
+    """Архив с выгрузкой и картинками постов, отдаваемый по частям."""
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(name, 'w', force_zip64=True) as output:
+            for line in lines:
+                output.write(line.encode())
+                yield stream.pop()
+        images = Post.objects.filter(author=user).exclude(
+            image='').order_by('pk').values_list('image', flat=True)
+        for image in images.iterator(chunk_size=CHUNK_SIZE):
+            if not image_storage.exists(image):
+                continue
+            # Картинки уже сжаты, второй раз их не жмём
+            info = zipfile.ZipInfo(image)
+            info.compress_type = zipfile.ZIP_STORED
+            with image_storage.open(image) as source, \
+                    archive.open(info, 'w', force_zip64=True) as output:
+                for chunk in source.chunks():
+                    output.write(chunk)
+                    yield stream.pop()
+    yield stream.pop()
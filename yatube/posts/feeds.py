@@ -0,0 +1,133 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Лента пользователя — строки FeedEntry (подписчик, пост), новые по id
+первыми. Новый пост одним bulk_create раскладывается в ленты всех
+подписчиков автора. Это вставка строк, а не «прочитать-изменить-
+записать»: одновременные посты разных авторов не затирают друг друга,
+а в транзакции ленты откатываются вместе с записью. Подписка дописывает
+в ленту последние посты автора, отписка их убирает, удаление поста
+уносит его из лент каскадом.
+
+Лента держится в пределах FEED_MAX_LENGTH: чтение берёт только столько
+строк, а лишнее у подписчика срезается при раскладке, раз в
+FEED_TRIM_EVERY его постов, — не на каждой вставке.
+
+Посты авторов с очень большим числом подписчиков не раскладываются
+по лентам, а подмешиваются при чтении (гибридный pull): один пост
+знаменитости не превращается в миллион вставок. Порядок лент держится
+на id: он растёт вместе с pub_date.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import follow_graph
+from .models import FeedEntry, Follow, Post, UserStats
+
+CELEBRITIES_KEY = 'feed:celebrities'
+CELEBRITIES_TIMEOUT = 60 * 10
+
+
+def celebrity_ids():
+    """id авторов, чьи посты не раскладываются по лентам подписчиков."""
+    ids = cache.get(CELEBRITIES_KEY)
+    if ids is None:
+        ids = set(
+            UserStats.objects.using(DEFAULT_DB_ALIAS).filter(
+                followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(CELEBRITIES_KEY, ids, CELEBRITIES_TIMEOUT)
+    return ids
+
+
+def _entries(user_id, posts):
+    return [FeedEntry(user_id=user_id, post_id=post_id, author_id=author_id)
+            for post_id, author_id in posts]
+
+
+def trim_feed(user_id):
+    """Срезает ленту пользователя до FEED_MAX_LENGTH постов."""
+    cutoff = FeedEntry.objects.filter(user_id=user_id).order_by(
+        '-post_id').values_list('post_id', flat=True)[
+            settings.FEED_MAX_LENGTH:settings.FEED_MAX_LENGTH + 1]
+    if cutoff:
+        FeedEntry.objects.filter(user_id=user_id,
+                                 post_id__lte=cutoff[0]).delete()
+
+
+def build_feed(user_id):
+    """Собирает ленту пользователя заново из подписок и постов."""
+    # IN по подписке, а не JOIN через пользователей: так SQLite идёт
+    # по индексу ленты и не сортирует выборку во временном дереве
+    followed = Follow.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=user_id).values('author_id')
+    posts = (Post.objects.using(DEFAULT_DB_ALIAS)
+             .filter(author_id__in=followed)
+             .order_by('-pub_date', '-id')
+             .values_list('id', 'author_id')[:settings.FEED_MAX_LENGTH])
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        FeedEntry.objects.bulk_create(_entries(user_id, posts))
+
+
+def get_feed_ids(user):
+    """id постов ленты пользователя, новые первыми."""
+    post_ids = list(
+        FeedEntry.objects.filter(user_id=user.pk).order_by('-post_id')
+        .values_list('post_id', flat=True)[:settings.FEED_MAX_LENGTH])
+
+    celebrities = celebrity_ids()
+    if not celebrities:
+        return post_ids
+    followed_celebrities = follow_graph.following(user, celebrities)
+    if followed_celebrities:
+        pulled = Post.objects.filter(
+            author_id__in=followed_celebrities
+        ).order_by('-pub_date', '-id').values_list('id', flat=True)
+        merged = set(post_ids).union(pulled[:settings.FEED_MAX_LENGTH])
+        post_ids = sorted(merged, reverse=True)[:settings.FEED_MAX_LENGTH]
+    return post_ids
+
+
+def _follower_ids(author_id):
+    """Подписчики автора или None, если их больше порога fan-out."""
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    follower_ids = list(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)[:limit + 1]
+    )
+    return None if len(follower_ids) > limit else follower_ids
+
+
+def push_post(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    follower_ids = _follower_ids(post.author_id)
+    if not follower_ids:
+        return
+    FeedEntry.objects.bulk_create(
+        FeedEntry(user_id=user_id, post_id=post.pk, author_id=post.author_id)
+        for user_id in follower_ids
+    )
+    # Каждому подписчику срез достаётся примерно раз в FEED_TRIM_EVERY
+    # его новых постов
+    every = settings.FEED_TRIM_EVERY
+    for user_id in follower_ids:
+        if (user_id + post.pk) % every == 0:
+            trim_feed(user_id)
+
+
+def add_author(user_id, author_id):
+    """Подписка: последние посты автора попадают в ленту."""
+    if author_id in celebrity_ids():
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('-pub_date', '-id')
+             .values_list('id', 'author_id')[:settings.FEED_MAX_LENGTH])
+    FeedEntry.objects.bulk_create(_entries(user_id, posts),
+                                  ignore_conflicts=True)
+    trim_feed(user_id)
+
+
+def remove_author(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
@@ -0,0 +1,125 @@
+"""Граф подписок: кто на кого подписан, из кэша.
+
+Для каждого пользователя в кэше лежат два отсортированных массива id
+array('I'): на кого он подписан (out) и кто подписан на него (in).
+Четыре байта на связь вместо списка int и пара десятков байт на запись
+кэша; принадлежность проверяется бинарным поиском.
+
+Массивы собираются из Follow при первом обращении, всегда с primary:
+граф с отставшей реплики прожил бы в кэше до FOLLOW_GRAPH_TIMEOUT.
+Сигналы подписки и отписки (posts.signals) сбрасывают их сразу и ещё
+раз после коммита, как поколение страниц (core.cache). Массовые операции
+в обход сигналов (import_posts) сбрасывают весь граф через reset():
+эпоха графа входит в ключи, и старые массивы просто истекают.
+"""
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+
+from .models import Follow
+
+EPOCH_KEY = 'follow:epoch'
+
+
+def _epoch():
+    epoch = cache.get(EPOCH_KEY)
+    if epoch is None:
+        cache.add(EPOCH_KEY, time.time_ns(), None)
+        epoch = cache.get(EPOCH_KEY)
+    return epoch
+
+
+def _key(direction, user_id, epoch=None):
+    return f'follow:{epoch or _epoch()}:{direction}:{user_id}'
+
+
+def _load(direction, user_id):
+    key = _key(direction, user_id)
+    ids = cache.get(key)
+    if ids is None:
+        follows = Follow.objects.using(DEFAULT_DB_ALIAS)
+        if direction == 'out':
+            rows = follows.filter(user_id=user_id).values_list(
+                'author_id', flat=True)
+        else:
+            rows = follows.filter(author_id=user_id).values_list(
+                'user_id', flat=True)
+        ids = array('I', sorted(rows))
+        cache.set(key, ids, settings.FOLLOW_GRAPH_TIMEOUT)
+    return ids
+
+
+def _pk(user):
+    """id из пользователя или самого id; None для анонима."""
+    if user is None or isinstance(user, int):
+        return user
+    return user.pk
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def followees(user):
+    """Отсортированные id авторов, на которых подписан user."""
+    return _load('out', _pk(user))
+
+
+def followers(author):
+    """Отсортированные id подписчиков author."""
+    return _load('in', _pk(author))
+
+
+def followees_count(user):
+    return len(followees(user))
+
+
+def followers_count(author):
+    return len(followers(author))
+
+
+def is_following(user, author):
+    user_id, author_id = _pk(user), _pk(author)
+    if user_id is None or author_id is None:
+        return False
+    return _contains(followees(user_id), author_id)
+
+
+def following(user, author_ids):
+    """Какие из author_ids user читает — одним чтением кэша.
+
+    Для страницы из многих постов: состояние подписки на всех авторов
+    сразу, без запроса на каждого.
+    """
+    user_id = _pk(user)
+    if user_id is None:
+        return set()
+    ids = followees(user_id)
+    return {author_id for author_id in author_ids
+            if _contains(ids, author_id)}
+
+
+def _delete(user_id, author_id):
+    epoch = _epoch()
+    cache.delete_many([_key('out', user_id, epoch),
+                       _key('in', author_id, epoch)])
+
+
+def invalidate(user_id, author_id):
+    """Подписка user_id на author_id изменилась.
+
+    Массивы, собранные другим запросом до коммита, ещё без этой
+    подписки, второй сброс после коммита отбрасывает.
+    """
+    _delete(user_id, author_id)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _delete(user_id, author_id))
+
+
+def reset():
+    cache.set(EPOCH_KEY, time.time_ns(), None)
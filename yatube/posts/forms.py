@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import TextInput
 
+from .images import process_upload
 from .models import Comment, Post
 
 
@@ -15,6 +17,13 @@ class PostForm(forms.ModelForm):
             'image': 'картинка',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Новая загрузка; старая картинка поста уже обработана
+        if isinstance(image, UploadedFile):
+            return process_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
@@ -0,0 +1,44 @@
+"""Персональные вставки страниц постов (core.esi).
+
+Каждая вставка знает только свои аргументы из метки и текущего
+пользователя, поэтому обходится без выборки поста и автора.
+"""
+from django.template.loader import render_to_string
+
+from core.esi import fragment
+
+from . import follow_graph
+from .forms import CommentForm
+
+
+@fragment('switcher')
+def switcher(request):
+    return render_to_string('includes/switcher.html', request=request)
+
+
+@fragment('profile_actions')
+def profile_actions(request, author_id, username):
+    is_owner = str(request.user.pk) == author_id
+    following = not is_owner and follow_graph.is_following(
+        request.user, int(author_id))
+    return render_to_string('includes/profile_actions.html', {
+        'username': username,
+        'is_owner': is_owner,
+        'following': following,
+    }, request)
+
+
+@fragment('post_actions')
+def post_actions(request, post_id, author_id):
+    return render_to_string('includes/post_actions.html', {
+        'post_id': post_id,
+        'is_author': str(request.user.pk) == author_id,
+    }, request)
+
+
+@fragment('comment_form')
+def comment_form(request, post_id):
+    return render_to_string('includes/comment_form.html', {
+        'post_id': post_id,
+        'form': CommentForm(),
+    }, request)
@@ -0,0 +1,64 @@
+"""Обработка загруженных картинок постов перед сохранением.
+
+Телефонные фото по 10–20 МБ иначе хранились бы и отдавались целиком.
+Здесь картинка проверяется по размеру файла и числу пикселей,
+поворачивается по EXIF и пересохраняется без метаданных с длинной
+стороной не больше IMAGE_MAX_SIDE. GIF сохраняются как есть, чтобы
+не терять анимацию, — для них действуют только ограничения.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+
+def check_limits(uploaded):
+    """Ограничения по байтам и пикселям; заголовок читается без
+    распаковки всей картинки."""
+    if uploaded.size > settings.IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ',
+            params={'limit': settings.IMAGE_MAX_BYTES // 2 ** 20})
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)d мегапикселей',
+            params={'limit': settings.IMAGE_MAX_PIXELS // 10 ** 6})
+
+
+def reencode(uploaded):
+    """Повёрнутая, уменьшенная и очищенная от EXIF копия загрузки."""
+    uploaded.seek(0)
+    with Image.open(uploaded) as source:
+        if source.format == 'GIF':
+            uploaded.seek(0)
+            return uploaded
+        image = ImageOps.exif_transpose(source)
+        # PNG иначе перенёс бы EXIF из info; ICC оставляем ради цветов
+        image.info.pop('exif', None)
+        icc_profile = image.info.get('icc_profile')
+        image.thumbnail((settings.IMAGE_MAX_SIDE, settings.IMAGE_MAX_SIDE),
+                        Image.LANCZOS)
+        transparent = image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info)
+        output = io.BytesIO()
+        if transparent:
+            image.save(output, 'PNG', optimize=True)
+            extension, content_type = 'png', 'image/png'
+        else:
+            image.convert('RGB').save(
+                output, 'JPEG', quality=settings.IMAGE_JPEG_QUALITY,
+                optimize=True, progressive=True, icc_profile=icc_profile)
+            extension, content_type = 'jpg', 'image/jpeg'
+    name = f'{os.path.splitext(uploaded.name)[0]}.{extension}'
+    return SimpleUploadedFile(name, output.getvalue(), content_type)
+
+
+def process_upload(uploaded):
+    check_limits(uploaded)
+    return reencode(uploaded)
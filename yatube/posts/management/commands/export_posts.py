@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии '
+            'и подписки в NDJSON-файл или каталог CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или каталог для CSV.')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            default='ndjson')
+        parser.add_argument('--media-dir',
+                            help='Куда скопировать картинки постов.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Строк на одно чтение из базы.')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Потоков для копирования картинок.')
+
+    def handle(self, *args, **options):
+        writer_class = (transfer.NdjsonWriter if options['format'] == 'ndjson'
+                        else transfer.CsvWriter)
+        writer = writer_class(options['path'])
+        try:
+            for kind, model, fields in transfer.RECORDS:
+                writer.write(kind, fields, transfer.export_rows(
+                    model, fields, options['chunk_size']))
+                self.stdout.write(f'{kind}: {model.objects.count()}')
+        finally:
+            writer.close()
+        if options['media_dir']:
+            self.copy_images(options)
+
+    def copy_images(self, options):
+        names = (Post.objects.exclude(image='').order_by()
+                 .values_list('image', flat=True).distinct())
+        copied = 0
+        batch = []
+        with ThreadPoolExecutor(options['workers']) as pool:
+            for name in names.iterator(chunk_size=options['chunk_size']):
+                batch.append(name)
+                if len(batch) == options['chunk_size']:
+                    copied += self.copy_batch(pool, options, batch)
+                    batch = []
+            copied += self.copy_batch(pool, options, batch)
+        self.stdout.write(f'Картинок скопировано: {copied}')
+
+    def copy_batch(self, pool, options, names):
+        # Пачка за пачкой, как в import_posts: pool.map завёл бы future
+        # на каждую картинку выгрузки сразу
+        futures = [pool.submit(transfer.copy_from_storage,
+                               options['media_dir'], name)
+                   for name in names]
+        for future in futures:
+            future.result()
+        return len(futures)
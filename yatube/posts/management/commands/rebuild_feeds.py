@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+from posts.models import FeedEntry, Follow, User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из Follow и Post.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, чьи ленты пересобрать (по умолчанию все).')
+
+    def handle(self, *args, **options):
+        user_ids = Follow.objects.values_list('user_id', flat=True).distinct()
+        if not options['usernames']:
+            # Ленты тех, кто больше ни на кого не подписан
+            FeedEntry.objects.exclude(
+                user_id__in=Follow.objects.values('user_id')).delete()
+        else:
+            user_ids = User.objects.filter(
+                username__in=options['usernames']
+            ).values_list('pk', flat=True)
+
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            feeds.build_feed(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
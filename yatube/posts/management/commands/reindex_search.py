@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс постов и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+        with transaction.atomic():
+            search.clear_index()
+        indexed = 0
+        batch = []
+        for post_id in post_ids.iterator(chunk_size=options['batch']):
+            batch.append(post_id)
+            if len(batch) == options['batch']:
+                indexed += self.index(batch)
+                batch = []
+        indexed += self.index(batch)
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
+
+    def index(self, post_ids):
+        # Пачка в одной транзакции: на SQLite это в разы быстрее
+        with transaction.atomic():
+            for post_id in post_ids:
+                search.index_post(post_id, with_comments=True)
+        return len(post_ids)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post, ThumbnailTask
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь миниатюры для всех уже загруженных картинок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true',
+                            help='Рендерить сразу, без очереди.')
+
+    def handle(self, *args, **options):
+        image_names = (Post.objects.exclude(image='').order_by()
+                       .values_list('image', flat=True).distinct())
+        if options['sync']:
+            count = 0
+            for name in image_names.iterator():
+                thumbnails.render_renditions(name)
+                count += 1
+            self.stdout.write(f'Готово миниатюр: {count}')
+            return
+
+        ThumbnailTask.objects.bulk_create(
+            (ThumbnailTask(image=name) for name in image_names.iterator()),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(
+            f'В очереди задач: {ThumbnailTask.objects.count()}')
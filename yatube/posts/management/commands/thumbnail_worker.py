@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры из очереди в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Размер пула (по умолчанию — число CPU).')
+        parser.add_argument('--batch', type=int, default=50)
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help='Пауза между опросами пустой очереди, с.')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и завершиться.')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(options['processes']) as pool:
+            while True:
+                image_names = thumbnails.claim(options['batch'])
+                if not image_names:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+                self.process(pool, image_names)
+
+    def process(self, pool, image_names):
+        # Дочерние процессы не должны унаследовать открытые соединения
+        connections.close_all()
+        futures = {pool.submit(thumbnails.render_renditions, name): name
+                   for name in image_names}
+        done = []
+        for future in as_completed(futures):
+            try:
+                done.append(future.result())
+            except Exception as error:
+                thumbnails.fail(futures[future], error)
+        if done:
+            thumbnails.complete(done)
+        self.stdout.write(f'Готово миниатюр: {len(done)}')
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:40
+
+from django.db import migrations
+
+
+def split_fts_table(apps, schema_editor):
+    # Комментарии переезжают в отдельные строки: по строке на комментарий
+    connection = schema_editor.connection
+    if (connection.vendor != 'sqlite'
+            or 'posts_search' not in connection.introspection.table_names()):
+        return
+    from posts.search import tokenize
+
+    schema_editor.execute('DROP TABLE posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search "
+        "USING fts5(text, tokenize='unicode61')"
+    )
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search_comments "
+        "USING fts5(post_id UNINDEXED, text, tokenize='unicode61')"
+    )
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    with connection.cursor() as cursor:
+        for post_id, text in Post.objects.values_list(
+                'pk', 'text').iterator():
+            cursor.execute(
+                'INSERT INTO posts_search (rowid, text) VALUES (%s, %s)',
+                [post_id, ' '.join(tokenize(text))])
+        for comment_id, post_id, text in Comment.objects.values_list(
+                'pk', 'post_id', 'text').iterator():
+            cursor.execute(
+                'INSERT INTO posts_search_comments (rowid, post_id, text) '
+                'VALUES (%s, %s, %s)',
+                [comment_id, post_id, ' '.join(tokenize(text))])
+
+
+def merge_fts_table(apps, schema_editor):
+    # Прежняя таблица создаётся пустой: её заполнит reindex_search
+    connection = schema_editor.connection
+    if (connection.vendor != 'sqlite'
+            or 'posts_search' not in connection.introspection.table_names()):
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_search_comments')
+    schema_editor.execute('DROP TABLE posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search "
+        "USING fts5(text, comments, tokenize='unicode61')"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_fts_table, merge_fts_table),
+    ]
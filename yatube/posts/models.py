@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -16,6 +18,12 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание группы',
     )
+    # Денормализованный счётчик, поддерживается сигналами (posts.counters)
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self) -> str:
         return self.title
@@ -49,14 +57,35 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True,
         help_text='Добавь картинку, если хочешь',
     )
     # Аргумент upload_to указывает директорию
     # в которую будут загружаться пользовательские файлы.
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False,
+    )
+    # Версия карточки поста в кэше (posts.cards): меняется при правке
+    # поста, а также его группы или автора
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        # Ленты читаются по убыванию pub_date (с id для keyset-пагинации):
+        # общая, группы и автора
+        indexes = [
+            models.Index(fields=['pub_date', 'id'], name='post_feed_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_feed_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_feed_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -87,6 +116,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -105,3 +138,154 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+            models.CheckConstraint(check=~models.Q(user=models.F('author')),
+                                   name='no_self_follow'),
+        ]
+        # Подписчики автора (fan-out лент); подписки пользователя
+        # покрывает уникальный индекс (user, author)
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписчика (posts.feeds)."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    # Копия post.author: отписка убирает посты автора без JOIN
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        # Уникальный индекс (user, post) — он же порядок чтения ленты
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_entry'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, чтобы не считать COUNT(*) на каждой странице."""
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0,
+    )
+
+    class Meta:
+        # Поиск «знаменитостей» для гибридной ленты (posts.feeds)
+        indexes = [
+            models.Index(fields=['followers_count'],
+                         name='stats_followers_idx'),
+        ]
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class ThumbnailTask(models.Model):
+    """Очередь на генерацию миниатюр загруженной картинки."""
+    image = models.CharField(
+        verbose_name='Картинка',
+        max_length=255,
+        unique=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата постановки',
+        auto_now_add=True,
+    )
+    started = models.DateTimeField(
+        verbose_name='Взята в работу',
+        blank=True,
+        null=True,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0,
+    )
+
+    class Meta:
+        ordering = ('created',)
+
+    def __str__(self):
+        return self.image
+
+
+class MediaBlob(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=255,
+        unique=True,
+    )
+    refs = models.PositiveIntegerField(
+        verbose_name='Ссылок',
+        default=0,
+    )
+
+    def __str__(self):
+        return self.name
+
+
+class SearchTerm(models.Model):
+    """Строка инвертированного индекса поиска: слово → пост.
+
+    Используется, когда база не SQLite с FTS5 (см. posts.search).
+    """
+    TERM_LENGTH = 64
+
+    term = models.CharField(
+        verbose_name='Слово',
+        max_length=TERM_LENGTH,
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+    )
+    weight = models.PositiveIntegerField(
+        verbose_name='Вес',
+        default=1,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post'], name='search_term_idx'),
+        ]
+
+    def __str__(self):
+        return self.term
@@ -0,0 +1,246 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+NEXT = 'n'
+PREVIOUS = 'p'
+# Пропуск в ряду номеров страниц
+GAP = None
+
+
+class CursorPage(Page):
+    """Страница keyset-пагинации: вместо номеров — курсоры соседних страниц."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        return self.next_cursor
+
+    def previous_page_number(self):
+        return self.previous_cursor
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Выборка идёт от позиции курсора по индексу, поэтому стоимость страницы
+    не зависит от её глубины. Общее число объектов не считается:
+    count, num_pages и page_range для этого режима не используются.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('pub_date', 'id')):
+        super().__init__(object_list, per_page)
+        self.ordering = ordering
+
+    def encode_cursor(self, direction, obj):
+        # isoformat вместо DjangoJSONEncoder: тот режет микросекунды,
+        # и сравнение по pub_date на границе страницы перестаёт совпадать.
+        values = [getattr(obj, field) for field in self.ordering]
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for value in values]
+        raw = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения) или None для битого курсора."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded))
+            model = self.object_list.model
+            values = [model._meta.get_field(field).to_python(value)
+                      for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            return None
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(
+                self.ordering):
+            return None
+        return direction, values
+
+    def _seek(self, values, lookup):
+        """Условие «строго после позиции» для составного ключа."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def get_page(self, cursor):
+        """Страница после/до курсора; без курсора — первая страница."""
+        position = self.decode_cursor(cursor) if cursor else None
+        queryset = self.object_list
+        newest_first = [f'-{field}' for field in self.ordering]
+
+        if position is None:
+            rows = list(queryset.order_by(*newest_first)[:self.per_page + 1])
+            return self._build_page(rows, more_after=None, going_back=False)
+
+        direction, values = position
+        if direction == NEXT:
+            rows = list(queryset.filter(self._seek(values, 'lt'))
+                        .order_by(*newest_first)[:self.per_page + 1])
+            return self._build_page(rows, more_after=True, going_back=False)
+
+        rows = list(queryset.filter(self._seek(values, 'gt'))
+                    .order_by(*self.ordering)[:self.per_page + 1])
+        if not rows:
+            # Более новых объектов не осталось — начинаем с начала ленты.
+            return self.get_page(None)
+        return self._build_page(rows, more_after=True, going_back=True)
+
+    def _build_page(self, rows, more_after, going_back):
+        # Лишняя строка говорит, есть ли объекты дальше по направлению чтения.
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if going_back:
+            rows.reverse()
+            has_previous, has_next = has_more, more_after
+        else:
+            has_previous, has_next = bool(more_after), has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(NEXT, rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(PREVIOUS, rows[0])
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+def page_window(page, on_each_side=2, on_ends=2):
+    """Номера страниц окном: 1 2 … 7 8 [9] 10 11 … 49 50.
+
+    Пропуск обозначается None; длина ряда не зависит от числа страниц.
+    """
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        yield from range(1, num_pages + 1)
+        return
+    start = max(page.number - on_each_side, 1)
+    end = min(page.number + on_each_side, num_pages)
+    if start > on_ends + 2:
+        yield from range(1, on_ends + 1)
+        yield GAP
+    else:
+        start = 1
+    if end < num_pages - on_ends - 1:
+        yield from range(start, end + 1)
+        yield GAP
+        yield from range(num_pages - on_ends + 1, num_pages + 1)
+    else:
+        yield from range(start, num_pages + 1)
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, чьи страницы знают свой ряд номеров (page.page_range).
+
+    Сами страницы — обычный Page: ленту проверяют на точный тип.
+    """
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.page_range = list(page_window(page))
+        return page
+
+
+def count_key(queryset):
+    """Ключ кэша по тексту SQL: одинаковые выборки делят один счётчик."""
+    sql = str(queryset.query).encode()
+    return f'count:{queryset.db}:{hashlib.md5(sql).hexdigest()}'
+
+
+def _refresh_count(key, queryset):
+    try:
+        total = queryset.count()
+        cache.set(key, (total, time.time() + settings.PAGINATOR_COUNT_TTL),
+                  settings.PAGINATOR_COUNT_TIMEOUT)
+        return total
+    finally:
+        cache.delete(f'{key}:lock')
+
+
+def _refresh_in_background(key, queryset):
+    def run():
+        try:
+            _refresh_count(key, queryset)
+        except Exception:
+            logger.exception('Не удалось пересчитать %s', key)
+        finally:
+            # У потока своё соединение — закрываем, чтобы не копились
+            connections.close_all()
+
+    threading.Thread(target=run, name=f'refresh-{key}', daemon=True).start()
+
+
+def cached_count(queryset):
+    """Число строк выборки из кэша, возможно устаревшее.
+
+    Свежим значение считается PAGINATOR_COUNT_TTL секунд; после этого
+    запрос получает старое число, а пересчёт уходит в фоновый поток —
+    один на ключ благодаря блокировке в кэше. COUNT(*) в запросе
+    выполняется, только если числа в кэше нет совсем. Считается всегда
+    на primary: число с отставшей реплики не должно попасть в кэш.
+    """
+    queryset = queryset.using(DEFAULT_DB_ALIAS)
+    key = count_key(queryset)
+    cached = cache.get(key)
+    if cached is None:
+        return _refresh_count(key, queryset)
+    total, fresh_until = cached
+    if time.time() > fresh_until and cache.add(
+            f'{key}:lock', True, settings.PAGINATOR_COUNT_TTL):
+        if settings.PAGINATOR_COUNT_ASYNC:
+            _refresh_in_background(key, queryset)
+        else:
+            total = _refresh_count(key, queryset)
+    return total
+
+
+class CachedCountPaginator(WindowedPaginator):
+    """Номерная пагинация с приблизительным числом объектов из кэша.
+
+    Несколько постов, появившихся за PAGINATOR_COUNT_TTL, сдвигают
+    только номер последней страницы; запрос за её пределы get_page
+    и так приводит к последней.
+    """
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+    def page(self, number):
+        # Paginator обрезает последнюю страницу по count; с устаревшим
+        # числом новые посты выпали бы из неё
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
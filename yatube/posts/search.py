@@ -0,0 +1,317 @@
+"""Полнотекстовый поиск по постам и комментариям к ним.
+
+Документ поиска — пост: его текст и тексты всех комментариев.
+Слова приводятся к нижнему регистру, ё заменяется на е, русские слова
+обрезаются до основы (стеммер Портера), поэтому «котами» находит «кот».
+На SQLite индекс хранится в виртуальных таблицах FTS5 с ранжированием
+bm25, на остальных базах — в таблице SearchTerm (слово → пост).
+
+В FTS5 у поста и у каждого комментария своя строка: комментарий
+индексируется под своим id с id поста в неиндексируемой колонке, и его
+запись меняет одну строку, сколько бы комментариев ни было у поста.
+Пост находится, если каждое слово запроса есть в его тексте или хотя
+бы в одном комментарии. В SearchTerm комментарий правит веса слов поста
+на месте (index_comment), не перечитывая остальные комментарии.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Q, Sum, When
+
+from .models import Comment, Post, SearchTerm
+
+FTS_TABLE = 'posts_search'
+FTS_COMMENTS_TABLE = 'posts_search_comments'
+# Вес слова из текста поста относительно слова из комментария
+TEXT_WEIGHT = 2
+COMMENT_WEIGHT = 1
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|'
+    r'ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|'
+    r'л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Портера."""
+    match = RV.match(word)
+    if not match:
+        return word
+    start, rv = match.groups()
+
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+
+    rv = re.sub(r'и$', '', rv, 1)
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_ENDING.sub('', rv, 1)
+    stripped = re.sub(r'ь$', '', rv, 1)
+    if stripped == rv:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        rv = re.sub(r'нн$', 'н', rv, 1)
+    else:
+        rv = stripped
+    return start + rv
+
+
+def tokenize(text):
+    """Нормализованные слова текста в порядке появления."""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(word) if CYRILLIC_RE.search(word) else word
+            for word in words]
+
+
+_fts_tables = {}
+
+
+def _use_fts():
+    backend = settings.SEARCH_BACKEND
+    if backend != 'auto':
+        return backend == 'fts5'
+    if connection.vendor != 'sqlite':
+        return False
+    # Таблицу FTS5 создаёт миграция, если SQLite собран с FTS5
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names())
+    return _fts_tables[name]
+
+
+def _term_counts(text):
+    return Counter(term[:SearchTerm.TERM_LENGTH] for term in tokenize(text))
+
+
+def index_post(post_id, with_comments=False):
+    """Переиндексирует пост.
+
+    В SearchTerm слова комментариев входят в веса поста, и документ
+    собирается целиком. В FTS5 комментарии лежат отдельными строками:
+    их переиндексирует только with_comments (полная переиндексация).
+    """
+    text = Post.objects.filter(pk=post_id).values_list(
+        'text', flat=True).first()
+    if text is None:
+        return unindex_post(post_id)
+
+    if _use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post_id, ' '.join(tokenize(text))])
+        if with_comments:
+            comments = Comment.objects.filter(post_id=post_id)
+            for comment_id, comment_text in comments.values_list(
+                    'pk', 'text'):
+                index_comment(comment_id, post_id, new_text=comment_text)
+        return
+
+    comments = ' '.join(
+        Comment.objects.filter(post_id=post_id).values_list('text', flat=True))
+    weights = Counter()
+    for term, count in _term_counts(text).items():
+        weights[term] += count * TEXT_WEIGHT
+    for term, count in _term_counts(comments).items():
+        weights[term] += count * COMMENT_WEIGHT
+    SearchTerm.objects.filter(post_id=post_id).delete()
+    SearchTerm.objects.bulk_create(
+        SearchTerm(post_id=post_id, term=term, weight=weight)
+        for term, weight in weights.items()
+    )
+
+
+def _weight_delta(counts):
+    return Case(*[When(term=term, then=count * COMMENT_WEIGHT)
+                  for term, count in counts.items()])
+
+
+def _add_weights(post_id, counts):
+    rows = SearchTerm.objects.filter(post_id=post_id, term__in=list(counts))
+    rows.update(weight=F('weight') + _weight_delta(counts))
+    existing = set(rows.values_list('term', flat=True))
+    SearchTerm.objects.bulk_create(
+        SearchTerm(post_id=post_id, term=term,
+                   weight=count * COMMENT_WEIGHT)
+        for term, count in counts.items() if term not in existing
+    )
+
+
+def _remove_weights(post_id, counts):
+    rows = SearchTerm.objects.filter(post_id=post_id, term__in=list(counts))
+    # Слово, которое было только в этом комментарии, уходит из индекса
+    rows.filter(Q(*[Q(term=term, weight__lte=count * COMMENT_WEIGHT)
+                    for term, count in counts.items()],
+                  _connector=Q.OR)).delete()
+    rows.update(weight=F('weight') - _weight_delta(counts))
+
+
+def index_comment(comment_id, post_id, old_text='', new_text='',
+                  old_post_id=None):
+    """Меняет в индексе текст одного комментария.
+
+    Новый комментарий — old_text пустой, удалённый — new_text пустой,
+    перенесённый к другому посту — old_post_id его прежний пост.
+    """
+    if _use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_COMMENTS_TABLE} WHERE rowid = %s',
+                [comment_id])
+            if new_text:
+                cursor.execute(
+                    f'INSERT INTO {FTS_COMMENTS_TABLE} (rowid, post_id, text) '
+                    'VALUES (%s, %s, %s)',
+                    [comment_id, post_id, ' '.join(tokenize(new_text))])
+        return
+
+    old_counts, new_counts = _term_counts(old_text), _term_counts(new_text)
+    with transaction.atomic():
+        if old_post_id is not None and old_post_id != post_id:
+            if old_counts:
+                _remove_weights(old_post_id, old_counts)
+            if new_counts:
+                _add_weights(post_id, new_counts)
+            return
+        # Общие слова старого и нового текста не трогаем
+        removed, added = old_counts - new_counts, new_counts - old_counts
+        if removed:
+            _remove_weights(post_id, removed)
+        if added:
+            _add_weights(post_id, added)
+
+
+def unindex_post(post_id):
+    # Строки комментариев FTS5 убирают их собственные сигналы удаления
+    if _use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+    else:
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+
+def clear_index():
+    if _use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'DELETE FROM {FTS_COMMENTS_TABLE}')
+    else:
+        SearchTerm.objects.all().delete()
+
+
+class SearchResults:
+    """Ленивая выдача поиска, совместимая с Paginator.
+
+    Paginator сначала спрашивает count(), а затем берёт срез — в индекс
+    уходят только эти два запроса, посты грузятся лишь для среза.
+    """
+
+    def __init__(self, query):
+        self.terms = list(dict.fromkeys(tokenize(query)))
+        self.use_fts = _use_fts()
+        self._count = None
+
+    def _any_term(self):
+        return ' OR '.join(f'"{term}"' for term in self.terms)
+
+    def _matched_sql(self):
+        """Посты, где каждое слово есть в тексте или в комментарии."""
+        per_term = (
+            f'SELECT * FROM (SELECT rowid AS post_id FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'UNION SELECT post_id FROM {FTS_COMMENTS_TABLE} '
+            f'WHERE {FTS_COMMENTS_TABLE} MATCH %s)'
+        )
+        params = []
+        for term in self.terms:
+            params += [f'"{term}"', f'"{term}"']
+        return ' INTERSECT '.join([per_term] * len(self.terms)), params
+
+    def _terms_queryset(self):
+        return (SearchTerm.objects.filter(term__in=self.terms)
+                .values('post').annotate(matched=Count('term'),
+                                         score=Sum('weight'))
+                .filter(matched=len(self.terms)))
+
+    def count(self):
+        if self._count is None:
+            self._count = self._fetch_count() if self.terms else 0
+        return self._count
+
+    def _fetch_count(self):
+        if not self.use_fts:
+            return self._terms_queryset().count()
+        matched, params = self._matched_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ({matched})', params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def ids(self, start, stop):
+        """id постов выдачи с start по stop, лучшие первыми."""
+        if not self.terms or stop <= start:
+            return []
+        if not self.use_fts:
+            return list(self._terms_queryset().order_by(
+                '-score', '-post').values_list('post', flat=True)[start:stop])
+        matched, params = self._matched_sql()
+        # Оценка поста — взвешенная сумма bm25 (rank) его текста
+        # и подходящих комментариев
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT post_id FROM ('
+                f'SELECT rowid AS post_id, %s * rank AS score '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'UNION ALL SELECT post_id, %s * rank '
+                f'FROM {FTS_COMMENTS_TABLE} '
+                f'WHERE {FTS_COMMENTS_TABLE} MATCH %s) '
+                f'WHERE post_id IN ({matched}) '
+                'GROUP BY post_id ORDER BY sum(score), post_id DESC '
+                'LIMIT %s OFFSET %s',
+                [TEXT_WEIGHT, self._any_term(),
+                 COMMENT_WEIGHT, self._any_term(),
+                 *params, stop - start, start])
+            return [row[0] for row in cursor.fetchall()]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        ids = self.ids(key.start or 0, key.stop or self.count())
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query):
+    return SearchResults(query)
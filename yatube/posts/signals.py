@@ -0,0 +1,196 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core.cache import bump_generation
+
+from . import blobs, counters, feeds, follow_graph, search, thumbnails
+from .cards import touch_posts
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if created:
+        feeds.push_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    if created:
+        feeds.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    feeds.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_follow_graph(sender, instance, **kwargs):
+    follow_graph.invalidate(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_pages(sender, **kwargs):
+    """Любая запись делает закэшированные страницы устаревшими."""
+    bump_generation()
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку поста перед правкой."""
+    if instance.pk is not None:
+        instance._old_group_id, instance._old_image = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', 'image').first() or (
+                None, None)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        counters.change_group_posts(instance.group_id, 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        counters.change_group_posts(old_group_id, -1)
+        counters.change_group_posts(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    counters.change_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        counters.change_user_counter(
+            instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, created, **kwargs):
+    """Новая картинка сразу уходит воркеру миниатюр."""
+    if instance.image and instance.image.name != getattr(
+            instance, '_old_image', None):
+        thumbnails.enqueue(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, **kwargs):
+    """Файл картинки общий для постов с одинаковым содержимым."""
+    old_image = getattr(instance, '_old_image', None) or ''
+    if created or instance.image.name != old_image:
+        blobs.acquire(instance.image.name)
+        blobs.release(None if created else old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_state(sender, instance, **kwargs):
+    instance._old_state = None
+    if instance.pk is not None:
+        instance._old_state = Comment.objects.filter(
+            pk=instance.pk).values_list('post_id', 'text').first()
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    """В индексе меняется только текст этого комментария."""
+    old_state = getattr(instance, '_old_state', None)
+    if old_state is None:
+        search.index_comment(instance.pk, instance.post_id,
+                             new_text=instance.text)
+        return
+    old_post_id, old_text = old_state
+    if (old_post_id, old_text) != (instance.post_id, instance.text):
+        search.index_comment(instance.pk, instance.post_id, old_text,
+                             instance.text, old_post_id=old_post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.index_comment(instance.pk, instance.post_id,
+                         old_text=instance.text)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def refresh_group_cards(sender, instance, created=False, **kwargs):
+    """В карточках постов стоит ссылка на группу."""
+    if not created:
+        touch_posts(Post.objects.filter(group=instance))
+
+
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields=None, **kwargs):
+    instance._old_names = None
+    # Вход сохраняет только last_login — лишний запрос тут ни к чему
+    if update_fields and not CARD_USER_FIELDS & set(update_fields):
+        return
+    if instance.pk is not None:
+        instance._old_names = User.objects.filter(pk=instance.pk).values_list(
+            'username', 'first_name', 'last_name').first()
+
+
+@receiver(post_save, sender=User)
+def refresh_author_cards(sender, instance, **kwargs):
+    """Имя автора есть в карточках его постов; вход (last_login) — нет."""
+    names = (instance.username, instance.first_name, instance.last_name)
+    old_names = getattr(instance, '_old_names', None)
+    if old_names is not None and old_names != names:
+        touch_posts(Post.objects.filter(author=instance))
+        bump_generation()
@@ -0,0 +1,91 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла — SHA-256 его байтов: posts/ab/ab12…ef.jpg. Одинаковые
+загрузки (репосты, один мем в разных группах) ложатся в один файл,
+а раз имя исходника общее, общие и его миниатюры sorl. Сколько постов
+ссылается на файл, считает MediaBlob (posts.blobs), последний
+удалённый пост уносит и файл.
+
+Файлы по содержимому не меняются, и mtime служит отметкой «файл снова
+взят загрузкой»: save обновляет её у уже лежащего файла, а новому ставит
+в прошлое на MEDIA_REUSE_GRACE. Проверка save и удаление файла
+(posts.blobs.delete_file) идут под одной блокировкой хранилища.
+"""
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """SHA-256 файла по кускам, без чтения целиком в память."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+LOCK_NAME = '.blobs.lock'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    @contextmanager
+    def locked(self):
+        """Блокировка между процессами: проверка файла против удаления."""
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reused_recently(self, name):
+        """Отдавал ли save этот файл за последние MEDIA_REUSE_GRACE с."""
+        try:
+            reused = os.path.getmtime(self.path(name))
+        except (FileNotFoundError, SuspiciousFileOperation):
+            return False
+        return time.time() - reused < settings.MEDIA_REUSE_GRACE
+
+    def content_name(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        with self.locked():
+            if self.exists(name):
+                # Ссылки на файл ещё нет: его не должен унести
+                # отложенный delete_file другого поста
+                os.utime(self.path(name))
+                return name
+        saved = self._save(name, content)
+        if saved != name:
+            # Такой же файл успел записать параллельный запрос
+            self.delete(saved)
+            os.utime(self.path(name))
+        else:
+            # Новый файл никем не взят повторно: удаляется сразу
+            past = time.time() - settings.MEDIA_REUSE_GRACE
+            os.utime(self.path(name), (past, past))
+        return name
+
+
+# Хранилище Post.image; sorl различает исходники и по классу хранилища,
+# поэтому миниатюры по имени файла строятся через него же
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,38 @@
+from django import template
+from django.conf import settings
+
+from posts.thumbnails import cached_rendition, webp_enabled
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image, name):
+    """Миниатюра из THUMBNAIL_RENDITIONS или None, пока она не готова."""
+    if not image:
+        return None
+    return cached_rendition(image, name)
+
+
+def _srcset(image, names, suffix=''):
+    candidates = []
+    for name in names:
+        thumbnail = cached_rendition(image, name + suffix)
+        if thumbnail:
+            width = settings.THUMBNAIL_RENDITIONS[name][0].split('x')[0]
+            candidates.append((thumbnail.url, width))
+    return ', '.join(f'{url} {width}w' for url, width in candidates), (
+        candidates[-1][0] if candidates else None)
+
+
+@register.inclusion_tag('includes/picture.html')
+def picture(image, group, css_class='', sizes='100vw'):
+    """<picture> с готовыми миниатюрами группы THUMBNAIL_SRCSET: WebP для
+    браузеров, которые его понимают, и JPEG; до готовности — оригинал."""
+    context = {'image': image, 'css_class': css_class, 'sizes': sizes}
+    if image:
+        names = settings.THUMBNAIL_SRCSET[group]
+        context['srcset'], context['src'] = _srcset(image, names)
+        if webp_enabled():
+            context['webp_srcset'], _ = _srcset(image, names, '.webp')
+    return context
@@ -1,4 +1,6 @@
 # posts/tests/test_forms.py
+import hashlib
+import io
 import shutil
 import tempfile
 from http import HTTPStatus
@@ -8,14 +10,23 @@ from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 from posts.models import Comment, Group, Post
 
+EXIF_ORIENTATION = 0x0112
+
 User = get_user_model()
 # Создаем временную папку для медиа-файлов;
 # на момент теста медиа папка будет переопределена
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def stored_name(content, extension):
+    """Имя картинки в хранилище: SHA-256 содержимого."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest}{extension}'
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
@@ -87,7 +98,7 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый пост',
-                image='posts/small.gif'
+                image=stored_name(small_gif, '.gif')
             ).exists()
         )
 
@@ -127,7 +138,7 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый пост изменён',
-                image='posts/smalll.gif'
+                image=stored_name(smalll_gif, '.gif')
             ).exists()
         )
         # Проверим, что ничего не упало и страница отдаёт код 200
@@ -176,3 +187,59 @@ class PostCreateFormTests(TestCase):
                 text='Тестовый коммент',
             ).exists()
         )
+
+
+def image_upload(name, size, fmt, mode='RGB', **save_kwargs):
+    output = io.BytesIO()
+    Image.new(mode, size).save(output, fmt, **save_kwargs)
+    return SimpleUploadedFile(name, output.getvalue(),
+                              content_type=f'image/{fmt.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': 'Фото', 'image': image})
+
+    def test_photo_is_oriented_resized_and_stripped(self):
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        self.create(image_upload('phone.jpeg', (3000, 1000), 'JPEG',
+                                 exif=exif.tobytes()))
+        post = Post.objects.get(text='Фото')
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w{64}\.jpg$')
+        with Image.open(post.image.path) as stored:
+            # Повёрнут по EXIF и ужат до IMAGE_MAX_SIDE
+            self.assertEqual(stored.size, (683, 2048))
+            self.assertNotIn(EXIF_ORIENTATION, stored.getexif())
+
+    def test_transparent_png_stays_png(self):
+        self.create(image_upload('logo.png', (10, 10), 'PNG', mode='RGBA'))
+        self.assertTrue(
+            Post.objects.get(text='Фото').image.name.endswith('.png'))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels(self):
+        response = self.create(image_upload('big.png', (20, 20), 'PNG'))
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка больше 0 мегапикселей')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_BYTES=10)
+    def test_too_many_bytes(self):
+        response = self.create(image_upload('big.png', (20, 20), 'PNG'))
+        self.assertFormError(response, 'form', 'image', 'Файл больше 0 МБ')
@@ -1,8 +1,28 @@
+import os
+import shutil
+import tempfile
+import time
+from array import array
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from posts.models import Comment, Group, Post
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core import routers
+from posts import blobs, follow_graph
+from posts.models import Comment, Follow, Group, MediaBlob, Post, UserStats
+from posts.storage import image_storage
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 # Пост
 
@@ -127,3 +147,238 @@ class CommentModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     comment._meta.get_field(value).verbose_name, expected)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.group_other = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assert_counters(self, posts, group_posts, comments=None, post=None):
+        self.user.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        if post is not None:
+            post.refresh_from_db()
+            self.assertEqual(post.comments_count, comments)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании, правке и удалении."""
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Ура')
+        self.assert_counters(1, 1, comments=1, post=post)
+
+        post.group = self.group_other
+        post.save()
+        self.assert_counters(1, 0)
+
+        post.group = self.group
+        post.save()
+        Comment.objects.filter(post=post).delete()
+        self.assert_counters(1, 1, comments=0, post=post)
+
+        post.delete()
+        self.assert_counters(0, 0)
+
+    def test_follow_counters(self):
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """recount чинит счётчики после bulk_create."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}', group=self.group)
+            for i in range(3)
+        )
+        self.assert_counters(0, 0)
+        call_command('recount', stdout=StringIO())
+        self.assert_counters(3, 3)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaBlobTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reposter')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def post(self, content, name='meme.gif'):
+        return Post.objects.create(
+            author=self.user, text='Мем',
+            image=SimpleUploadedFile(name, content, content_type='image/gif'))
+
+    def refs(self, name):
+        blob = MediaBlob.objects.filter(name=name).first()
+        return blob and blob.refs
+
+    @mock.patch('posts.blobs.transaction.on_commit', lambda func: func())
+    def test_same_image_is_stored_once(self):
+        first = self.post(b'GIF89a-meme')
+        second = self.post(b'GIF89a-meme', name='repost.gif')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))),
+                         1)
+        self.assertEqual(self.refs(name), 2)
+
+        first.delete()
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(os.path.exists(second.image.path))
+        self.age(second.image.path)
+        second.delete()
+        self.assertIsNone(self.refs(name))
+        self.assertFalse(os.path.exists(second.image.path))
+
+    def age(self, path):
+        # Повторная загрузка была дольше MEDIA_REUSE_GRACE назад
+        past = time.time() - settings.MEDIA_REUSE_GRACE
+        os.utime(path, (past, past))
+
+    def test_concurrent_acquire_keeps_blob(self):
+        """acquire после последнего release создаёт строку заново."""
+        name = self.post(b'GIF89a-race').image.name
+        with transaction.atomic():
+            blobs.release(name)
+            blobs.acquire(name)
+        self.assertEqual(self.refs(name), 1)
+        blobs.release(name)
+        self.assertIsNone(self.refs(name))
+
+    def test_pending_delete_spares_reused_file(self):
+        """Файл, снова отданный загрузке до её acquire, не удаляется."""
+        post = self.post(b'GIF89a-reused')
+        name, path = post.image.name, post.image.path
+        with mock.patch('posts.blobs.transaction.on_commit') as on_commit:
+            post.delete()
+        # Та же картинка загружается, пока удаление ждёт коммита
+        self.assertEqual(image_storage.save('posts/again.gif',
+                                            ContentFile(b'GIF89a-reused')),
+                         name)
+        on_commit.call_args[0][0]()
+        self.assertTrue(os.path.exists(path))
+        self.age(path)
+        blobs.delete_file(name)
+        self.assertFalse(os.path.exists(path))
+
+    @mock.patch('posts.blobs.transaction.on_commit', lambda func: func())
+    def test_replaced_image_is_released(self):
+        post = self.post(b'GIF89a-old')
+        old = post.image.name
+        post.image = SimpleUploadedFile('new.gif', b'GIF89a-new')
+        post.save()
+        self.assertIsNone(self.refs(old))
+        self.assertEqual(self.refs(post.image.name), 1)
+
+    def test_recount(self):
+        name = self.post(b'GIF89a-recount').image.name
+        MediaBlob.objects.all().delete()
+        blobs.recount()
+        self.assertEqual(self.refs(name), 1)
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sets_are_cached(self):
+        first, second, third = self.authors
+        self.assertEqual(list(follow_graph.followees(self.reader)),
+                         sorted([first.pk, second.pk]))
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.is_following(self.reader, first))
+            self.assertFalse(follow_graph.is_following(self.reader, third))
+            self.assertEqual(follow_graph.followees_count(self.reader), 2)
+        self.assertEqual(list(follow_graph.followers(first)),
+                         [self.reader.pk])
+        self.assertFalse(follow_graph.is_following(None, first))
+
+    def test_batch_membership(self):
+        author_ids = [author.pk for author in self.authors]
+        with self.assertNumQueries(1):
+            followed = follow_graph.following(self.reader, author_ids)
+        self.assertEqual(followed, set(author_ids[:2]))
+
+    def test_follow_and_unfollow_invalidate(self):
+        author = self.authors[2]
+        self.assertFalse(follow_graph.is_following(self.reader, author))
+        self.assertEqual(follow_graph.followers_count(author), 0)
+        self.client.force_login(self.reader)
+
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': author.username}))
+        self.assertTrue(follow_graph.is_following(self.reader, author))
+        self.assertEqual(follow_graph.followers_count(author), 1)
+
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': author.username}))
+        self.assertFalse(follow_graph.is_following(self.reader, author))
+        self.assertEqual(follow_graph.followers_count(author), 0)
+
+    def test_reset_after_bulk_changes(self):
+        follow_graph.followees(self.reader)
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.authors[2])])
+        self.assertEqual(follow_graph.followees_count(self.reader), 2)
+        follow_graph.reset()
+        self.assertEqual(follow_graph.followees_count(self.reader), 3)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class FollowGraphCommitTest(TransactionTestCase):
+    # on_commit срабатывает только вне обёртки TestCase
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+
+    def test_invalidated_again_after_commit(self):
+        with transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+            # Параллельный запрос успел собрать граф до коммита
+            cache.set(follow_graph._key('out', self.reader.pk), array('I'))
+        self.assertTrue(follow_graph.is_following(self.reader, self.author))
+
+    def test_loaded_from_primary(self):
+        token = routers.open_route(sticky=False)
+        routers.current_route().allow_replica()
+        try:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                follow_graph.followers(self.author)
+        finally:
+            routers.close_route(token)
+        self.assertEqual(len(replica), 0)
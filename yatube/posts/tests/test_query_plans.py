@@ -0,0 +1,122 @@
+# posts/tests/test_query_plans.py
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Полный проход по таблице приложения без индекса
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+$')
+# Сортировка во временном B-дереве вместо чтения по индексу
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+# Осознанные исключения. Холодная сборка ленты подписок (posts.feeds)
+# берёт посты авторов по индексу (author, pub_date) и сортирует только
+# их — это дешевле, чем сканировать общую ленту, и бывает редко.
+# Выдача поиска упорядочена по релевантности, которой нет в индексе:
+# сортируются только найденные посты.
+ALLOWED = [
+    re.compile(r'WHERE "posts_post"\."author_id" IN \(SELECT U0\."author_id" '
+               r'FROM "posts_follow" U0 WHERE U0\."user_id" = \d+\)'),
+    re.compile(r'ORDER BY sum\(score\), post_id DESC'),
+]
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class FeedQueryPlanTest(TestCase):
+    """Запросы лент идут по индексам: без полных сканов и сортировок.
+
+    Для каждой страницы собираются все её SELECT к таблицам posts_*,
+    и по каждому снимается EXPLAIN QUERY PLAN. Тест падает, если индекс
+    пропал или запрос перестал в него попадать.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.reader = User.objects.create_user(username='test-reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        for i in range(15):
+            post = Post.objects.create(author=cls.user, group=cls.group,
+                                       text=f'Тестовый текст {i}')
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f'Коммент {i}')
+        cls.post = post
+        # Комментарии последнего поста не влезают на одну страницу
+        for i in range(settings.COMMENTS_PER_PAGE):
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f'Ещё коммент {i}')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def cursors(self, url, param='cursor', context_name='page_obj'):
+        """Курсоры «вперёд» с первой страницы и «назад» со второй."""
+        cache.clear()
+        url += '&' if '?' in url else '?'
+        first = self.client.get(f'{url}{param}=').context[context_name]
+        self.assertIsNotNone(first.next_cursor)
+        next_url = f'{url}{param}={first.next_cursor}'
+        second = self.client.get(next_url).context[context_name]
+        self.assertIsNotNone(second.previous_cursor)
+        return [next_url, f'{url}{param}={second.previous_cursor}']
+
+    def bad_plans(self, url):
+        # Страница из кэша не сделала бы ни одного запроса
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        problems = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            if any(pattern.search(sql) for pattern in ALLOWED):
+                continue
+            for step in query_plan(sql):
+                if FULL_SCAN.match(step) or TEMP_SORT.search(step):
+                    problems.append(f'{step}\n    {sql}')
+        return problems
+
+    def test_feed_queries_use_indexes(self):
+        post_url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.pk})
+        search_url = reverse('posts:search') + '?q=Тестовый'
+        feed_urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'test-author'}),
+        ]
+        urls = feed_urls + [
+            reverse('posts:index') + '?page=2',
+            post_url,
+            reverse('posts:follow_index'),
+            search_url,
+            search_url + '&page=2',
+        ]
+        for url in feed_urls:
+            urls += self.cursors(url)
+        urls += self.cursors(post_url, 'comments', 'comments')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.bad_plans(url), [])
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from posts.models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+OLD_DATE = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TransferCommandsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        author = User.objects.create_user(username='test-author',
+                                          password='secret')
+        reader = User.objects.create_user(username='test-reader')
+        group = Group.objects.create(title='Группа', slug='test-slug',
+                                     description='Описание')
+        post = Post.objects.create(
+            author=author, group=group, text='Пост с картинкой',
+            image=SimpleUploadedFile('transfer.gif', b'GIF89a',
+                                     content_type='image/gif'))
+        Post.objects.filter(pk=post.pk).update(pub_date=OLD_DATE)
+        Post.objects.create(author=reader, text='Пост без группы')
+        Comment.objects.create(post=post, author=reader, text='Коммент')
+        Follow.objects.create(user=reader, author=author)
+        self.image = post.image.name
+
+    def wipe(self):
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def roundtrip(self, path, fmt):
+        media = os.path.join(self.workdir, 'media')
+        call_command('export_posts', path, format=fmt, media_dir=media,
+                     stdout=StringIO())
+        self.wipe()
+        call_command('import_posts', path, format=fmt, media_dir=media,
+                     stdout=StringIO())
+
+    def assert_restored(self):
+        self.assertEqual(User.objects.count(), 2)
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertEqual(post.pub_date, OLD_DATE)
+        self.assertEqual(post.group.slug, 'test-slug')
+        self.assertTrue(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, self.image)))
+        self.assertIsNone(Post.objects.get(text='Пост без группы').group)
+        self.assertEqual(post.comments.get().author.username, 'test-reader')
+        self.assertTrue(Follow.objects.filter(
+            user__username='test-reader',
+            author__username='test-author').exists())
+        self.assertTrue(self.client.login(username='test-author',
+                                          password='secret'))
+        # Производные данные пересобраны после bulk_create
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(UserStats.objects.get(
+            user__username='test-author').followers_count, 1)
+
+    def test_ndjson_roundtrip(self):
+        path = os.path.join(self.workdir, 'dump.ndjson')
+        self.roundtrip(path, 'ndjson')
+        self.assert_restored()
+
+    def test_csv_roundtrip(self):
+        path = os.path.join(self.workdir, 'dump')
+        self.roundtrip(path, 'csv')
+        self.assert_restored()
+
+    def test_export_copies_images_in_batches(self):
+        author = User.objects.get(username='test-author')
+        for number in range(3):
+            Post.objects.create(
+                author=author, text=f'Картинка {number}',
+                image=SimpleUploadedFile(f'{number}.gif',
+                                         b'GIF89a' + bytes([number]),
+                                         content_type='image/gif'))
+        media = os.path.join(self.workdir, 'media')
+        with mock.patch('posts.transfer.copy_from_storage') as copy:
+            call_command('export_posts',
+                         os.path.join(self.workdir, 'dump.ndjson'),
+                         media_dir=media, chunk_size=2, stdout=StringIO())
+        self.assertEqual(copy.call_count, 4)
+
+    def test_import_resumes_from_checkpoint(self):
+        path = os.path.join(self.workdir, 'dump.ndjson')
+        media = os.path.join(self.workdir, 'media')
+        call_command('export_posts', path, media_dir=media,
+                     stdout=StringIO())
+        self.wipe()
+        with mock.patch('posts.transfer.copy_to_storage',
+                        side_effect=OSError('диск отвалился')):
+            with self.assertRaises(OSError):
+                call_command('import_posts', path, media_dir=media,
+                             stdout=StringIO())
+        # Пользователи и группа загружены, пачка постов — нет
+        with open(f'{path}.checkpoint') as checkpoint:
+            self.assertEqual(json.load(checkpoint), {'dump.ndjson': 3})
+
+        call_command('import_posts', path, media_dir=media,
+                     stdout=StringIO())
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+        self.assert_restored()
@@ -1,15 +1,29 @@
 # posts/tests/test_views.py
+import csv
+import hashlib
+import io
+import json
 import shutil
 import tempfile
+import zipfile
+from io import StringIO
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from core.cache import bump_generation, get_generation
+from core.middleware import QueryBudgetExceeded
+from posts import feeds, thumbnails
+from posts.models import (Comment, FeedEntry, Follow, Group, Post,
+                          ThumbnailTask)
+from posts.paginators import GAP, CachedCountPaginator, count_key
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -222,6 +236,108 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response2.context['page_obj']),
                                  AMMOUNT_PAGE2)
 
+
+class PageWindowTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {i}') for i in range(500))
+
+    def setUp(self):
+        cache.clear()
+
+    def page_range(self, number):
+        paginator = CachedCountPaginator(Post.objects.order_by('-pub_date'),
+                                         10)
+        return paginator.get_page(number).page_range
+
+    def test_window(self):
+        cases = {
+            1: [1, 2, 3, GAP, 49, 50],
+            6: [1, 2, 3, 4, 5, 6, 7, 8, GAP, 49, 50],
+            25: [1, 2, GAP, 23, 24, 25, 26, 27, GAP, 49, 50],
+            50: [1, 2, GAP, 48, 49, 50],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(self.page_range(number), expected)
+
+    def test_rendered_links_do_not_grow_with_pages(self):
+        response = self.client.get(reverse('posts:index') + '?page=25')
+        self.assertEqual(response.content.decode().count('page-item'), 15)
+        self.assertContains(response, '?page=50')
+
+    def test_count_is_cached(self):
+        queryset = Post.objects.order_by('-pub_date')
+        self.assertEqual(CachedCountPaginator(queryset, 10).count, 500)
+        Post.objects.create(author=self.user, text='Новый')
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(queryset, 10).count, 500)
+
+    def test_stale_count_is_refreshed(self):
+        queryset = Post.objects.order_by('-pub_date')
+        CachedCountPaginator(queryset, 10).count
+        Post.objects.create(author=self.user, text='Новый')
+        total, _ = cache.get(count_key(queryset))
+        cache.set(count_key(queryset), (total, 0))
+        self.assertEqual(CachedCountPaginator(queryset, 10).count, 501)
+
+
+@override_settings(PAGINATION_MODE='keyset')
+class KeysetPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        # У bulk_create одинаковый pub_date, порядок держится на id
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Тестовый текст {i}', group=cls.group)
+            for i in range(13)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_pages(self):
+        """Курсоры ведут на следующую и обратно на первую страницу."""
+        index_list = {
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'test-author'}),
+        }
+        for reverse_name in index_list:
+            with self.subTest(reverse_name=reverse_name):
+                first = self.guest_client.get(reverse_name).context['page_obj']
+                self.assertEqual(len(first), settings.AMOUNT_OF_POSTS)
+                self.assertFalse(first.has_previous())
+
+                second = self.guest_client.get(
+                    reverse_name, {'cursor': first.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertNotIn(second[0], first.object_list)
+
+                back = self.guest_client.get(
+                    reverse_name, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(back.object_list, first.object_list)
+
+    def test_broken_cursor_opens_first_page(self):
+        """Битый курсор не роняет страницу."""
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'cursor': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.AMOUNT_OF_POSTS)
+
 # Кэш
 
 
@@ -245,6 +361,138 @@ class CacheIndexPageTest(TestCase):
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response, response_2)
 
+    def test_cache_serves_page_until_write(self):
+        """Страница берётся из кэша, пока не было записей."""
+        guest_client = Client()
+        Post.objects.create(text='Первый пост', author=self.user)
+        guest_client.get(reverse('posts:index'))
+
+        Post.objects.update(text='Тихая правка')
+        response = guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Первый пост')
+
+        Post.objects.create(text='Второй пост', author=self.user)
+        response = guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Второй пост')
+        # Карточка первого поста из кэша: update() не сдвинул его updated
+        self.assertContains(response, 'Первый пост')
+
+
+class SharedPageCacheTest(TestCase):
+    """Одно тело страницы на всех, персональные вставки — каждому своё."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.fan = User.objects.create_user(username='fan')
+        cls.stranger = User.objects.create_user(username='stranger')
+        Follow.objects.create(user=cls.fan, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.profile_url = reverse('posts:profile',
+                                   kwargs={'username': 'author'})
+        self.post_url = reverse('posts:post_detail',
+                                kwargs={'post_id': self.post.pk})
+
+    def get_as(self, user, url):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        return client.get(url)
+
+    def test_profile_actions_are_personal(self):
+        self.get_as(None, self.profile_url)
+        cases = {
+            self.fan: ('Отписаться', 'Подписаться'),
+            self.stranger: ('Подписаться', 'Отписаться'),
+            self.author: ('Скачать мои записи', 'Подписаться'),
+        }
+        for user, (shown, hidden) in cases.items():
+            with self.subTest(user=user.username):
+                response = self.get_as(user, self.profile_url)
+                self.assertTemplateNotUsed(response, 'posts/profile.html')
+                self.assertContains(response, shown)
+                self.assertNotContains(response, hidden)
+                self.assertContains(
+                    response, f'Пользователь: {user.username}')
+
+    def test_post_detail_actions_are_personal(self):
+        response = self.get_as(self.stranger, self.post_url)
+        self.assertNotContains(response, 'Изменить Пост')
+        self.assertContains(response, 'Добавить комментарий')
+
+        response = self.get_as(self.author, self.post_url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, 'Изменить Пост')
+
+        response = self.get_as(None, self.post_url)
+        self.assertNotContains(response, 'Изменить Пост')
+        self.assertNotContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, 'Пользователь:')
+
+    def test_cached_body_has_no_personal_data(self):
+        self.get_as(self.author, self.post_url)
+        path = hashlib.md5(self.post_url.encode()).hexdigest()
+        body, _ = cache.get(
+            f'shared_page.post_page.{get_generation()}.{path}')
+        self.assertIn('<!--personal:post_actions:', body)
+        self.assertIn('<!--personal:header-->', body)
+        self.assertNotIn('Изменить Пост', body)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author',
+                                            first_name='Лев')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(text='Первая версия',
+                                        author=self.user, group=self.group)
+        self.client.get(reverse('posts:index'))
+
+    def test_card_is_cached_until_post_changes(self):
+        Post.objects.update(text='Тихая правка')
+        bump_generation()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Первая версия')
+
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Вторая версия'})
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Вторая версия')
+
+    def test_group_and_author_changes_refresh_cards(self):
+        self.group.slug = 'new-slug'
+        self.group.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '/group/new-slug/')
+
+        self.user.first_name = 'Фёдор'
+        self.user.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Фёдор')
+
+    def test_login_does_not_refresh_cards(self):
+        updated = Post.objects.get(pk=self.post.pk).updated
+        self.user.set_password('pass')
+        self.user.save(update_fields=['password'])
+        self.assertTrue(self.client.login(username='test-author',
+                                          password='pass'))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).updated, updated)
+
 # Подписка
 
 
@@ -284,3 +532,470 @@ class FollowViewsTest(TestCase):
                                           kwargs={'username':
                                                   self.user_a}))
         self.assertEqual(Follow.objects.count(), count_follow - 1)
+
+    def feed_rows(self):
+        return list(FeedEntry.objects.filter(user=self.user_f).order_by(
+            '-post_id').values_list('post_id', flat=True))
+
+    def test_follow_index_shows_new_posts(self):
+        """Новый пост автора раскладывается в ленту подписчика."""
+        Follow.objects.create(user=self.user_f, author=self.user_a)
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+        new_post = Post.objects.create(author=self.user_a, text='Новый пост')
+        self.assertEqual(self.feed_rows(), [new_post.pk, self.post.pk])
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+        new_post.delete()
+        self.assertEqual(feeds.get_feed_ids(self.user_f), [self.post.pk])
+
+    def test_posts_of_two_authors_are_both_pushed(self):
+        other = User.objects.create(username='test-autor-2')
+        Follow.objects.create(user=self.user_f, author=self.user_a)
+        Follow.objects.create(user=self.user_f, author=other)
+        first = Post.objects.create(author=self.user_a, text='Первый')
+        second = Post.objects.create(author=other, text='Второй')
+        self.assertEqual(feeds.get_feed_ids(self.user_f),
+                         [second.pk, first.pk, self.post.pk])
+
+    def test_unfollow_removes_author_posts(self):
+        follow = Follow.objects.create(user=self.user_f, author=self.user_a)
+        self.assertEqual(self.feed_rows(), [self.post.pk])
+        follow.delete()
+        self.assertEqual(self.feed_rows(), [])
+
+    @override_settings(FEED_MAX_LENGTH=2, FEED_TRIM_EVERY=1)
+    def test_feed_is_trimmed(self):
+        Follow.objects.create(user=self.user_f, author=self.user_a)
+        posts = [Post.objects.create(author=self.user_a, text=f'Пост {i}')
+                 for i in range(3)]
+        self.assertEqual(self.feed_rows(), [posts[2].pk, posts[1].pk])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_celebrity_posts_are_pulled(self):
+        """Посты «знаменитостей» подмешиваются при чтении ленты."""
+        Follow.objects.create(user=self.user_f, author=self.user_a)
+        feeds.build_feed(self.user_f.pk)
+        cache.delete(feeds.CELEBRITIES_KEY)
+
+        new_post = Post.objects.create(author=self.user_a, text='Новый пост')
+        self.assertEqual(self.feed_rows(), [self.post.pk])
+        self.assertEqual(feeds.get_feed_ids(self.user_f),
+                         [new_post.pk, self.post.pk])
+
+    def test_rebuild_feeds_command(self):
+        Follow.objects.create(user=self.user_f, author=self.user_a)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(self.feed_rows(), [self.post.pk])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailQueueTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_image_is_queued_and_rendered(self):
+        """Картинка встаёт в очередь, а после воркера в карточке миниатюра."""
+        uploaded = SimpleUploadedFile(
+            name='queued.gif',
+            content=(
+                b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                b'\x0A\x00\x3B'
+            ),
+            content_type='image/gif'
+        )
+        post = Post.objects.create(author=self.user, text='С картинкой',
+                                   image=uploaded)
+        self.assertTrue(
+            ThumbnailTask.objects.filter(image=post.image.name).exists())
+
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+
+        self.assertEqual(thumbnails.claim(10), [post.image.name])
+        thumbnails.render_renditions(post.image.name)
+        thumbnails.complete([post.image.name])
+        self.assertFalse(ThumbnailTask.objects.exists())
+
+        rendition = thumbnails.cached_rendition(post.image, 'card')
+        small = thumbnails.cached_rendition(post.image, 'card_small')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, rendition.url)
+        self.assertContains(response, f'srcset="{small.url} 480w, '
+                                      f'{rendition.url} 960w"')
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.post_cats = Post.objects.create(
+            author=cls.user, text='Рыжие коты спят на солнышке')
+        cls.post_dogs = Post.objects.create(
+            author=cls.user, text='Собака гуляет во дворе')
+        Comment.objects.create(post=cls.post_dogs, author=cls.user,
+                               text='А мой кот боится собак')
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def check_search(self):
+        # Словоформы сводятся к основе: «котом» находит «коты» и «кот»
+        self.assertEqual(self.search('котом'),
+                         [self.post_cats, self.post_dogs])
+        self.assertEqual(self.search('собаки'), [self.post_dogs])
+        self.assertEqual(self.search('рыжий кот'), [self.post_cats])
+        self.assertEqual(self.search('жираф'), [])
+
+        comment = Comment.objects.create(post=self.post_cats, author=self.user,
+                                         text='Рядом прошёл жираф')
+        self.assertEqual(self.search('жирафы'), [self.post_cats])
+        comment.text = 'Рядом прошёл слон'
+        comment.save()
+        self.assertEqual(self.search('жираф'), [])
+        self.assertEqual(self.search('слона'), [self.post_cats])
+        comment.delete()
+        self.assertEqual(self.search('слон'), [])
+        # Слово из оставшегося комментария не пропало из документа
+        self.assertEqual(self.search('собак боится'), [self.post_dogs])
+
+        post = Post.objects.get(pk=self.post_cats.pk)
+        post.text = 'Теперь про жирафа'
+        post.save()
+        self.assertEqual(self.search('жирафы'), [post])
+        post.delete()
+        self.assertEqual(self.search('жираф'), [])
+
+    def test_search_fts(self):
+        """Поиск через FTS5 находит посты по словоформам и комментариям."""
+        self.check_search()
+
+    def test_comment_does_not_reread_post_comments(self):
+        """Новый комментарий индексируется без чтения остальных."""
+        for backend in ('fts5', 'table'):
+            with self.subTest(backend=backend), \
+                    self.settings(SEARCH_BACKEND=backend), \
+                    CaptureQueriesContext(connection) as queries:
+                Comment.objects.create(post=self.post_dogs, author=self.user,
+                                       text='Ещё одна собака')
+            self.assertFalse([query for query in queries.captured_queries
+                              if query['sql'].startswith('SELECT')
+                              and 'posts_comment' in query['sql']])
+            if backend == 'fts5':
+                # Меняется только строка самого комментария
+                self.assertFalse([query for query in queries.captured_queries
+                                  if 'posts_search ' in query['sql']])
+
+    def test_comment_words_stay_in_their_comment(self):
+        """Удаление комментария не трогает слова соседних."""
+        first, second, third = [
+            Comment.objects.create(post=self.post_cats, author=self.user,
+                                   text=text)
+            for text in ('Большой злой', 'пёс спит', 'злой пёс')
+        ]
+        third.delete()
+        self.assertEqual(self.search('злой пёс'), [self.post_cats])
+        first.delete()
+        self.assertEqual(self.search('злой'), [])
+        self.assertEqual(self.search('пёс спит'), [self.post_cats])
+        second.delete()
+        self.assertEqual(self.search('пёс'), [])
+
+    @override_settings(SEARCH_BACKEND='table')
+    def test_search_table(self):
+        """Тот же поиск по таблице SearchTerm."""
+        call_command('reindex_search', stdout=StringIO())
+        self.check_search()
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': 'собаки'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.post_dogs])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test-author',
+                                              first_name='Лев')
+        cls.reader = User.objects.create_user(username='test-reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = cls.add_posts(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def add_posts(cls, amount):
+        for i in range(amount):
+            # Картинки тоже не должны добавлять запросов на пост
+            uploaded = SimpleUploadedFile(
+                name=f'budget{i}.gif',
+                content=(
+                    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                    b'\x0A\x00\x3B'
+                ),
+                content_type='image/gif'
+            )
+            post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text=f'Тестовый текст {i}',
+                                       image=uploaded)
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f'Тестовый коммент {i}')
+        return post
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Число запросов не растёт вместе с числом постов и комментариев."""
+        self.client.force_login(self.reader)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'test-author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=текст',
+        ]
+        few = {url: self.count_queries(url) for url in urls}
+        self.add_posts(settings.AMOUNT_OF_POSTS)
+        for _ in range(5):
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text='Ещё коммент')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 1},
+                       QUERY_BUDGET_RAISE=True)
+    def test_budget_exceeded_raises(self):
+        cache.clear()
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('posts:index'))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.post = Post.objects.create(text='Тестовый текст', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_feed_returns_304_until_write(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        Post.objects.create(text='Новый пост', author=self.user)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_304_skips_view(self):
+        url = reverse('posts:profile', kwargs={'username': 'test-author'})
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+    def test_validators_differ_per_user(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+
+        self.client.force_login(self.user)
+        logged_in = self.revalidate(url, response)
+        self.assertEqual(logged_in.status_code, 200)
+        self.assertNotIn('Last-Modified', logged_in)
+
+    def test_post_detail_changes_with_comments(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response[
+                'Last-Modified']).status_code, 304)
+
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Коммент')
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def login(self, client):
+        """Вход через форму, как в браузере: вход меняет CSRF-токен."""
+        login_url = reverse('users:login')
+        token = client.get(login_url).context['csrf_token']
+        client.post(login_url, {'username': 'test-reader',
+                                'password': 'pass',
+                                'csrfmiddlewaretoken': str(token)})
+
+    def test_relogin_invalidates_csrf_form(self):
+        """После нового входа страница с формой не отдаётся по 304."""
+        User.objects.create_user(username='test-reader', password='pass')
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.login(client)
+        response = client.get(url)
+        client.post(reverse('users:logout'))
+        self.login(client)
+
+        revalidated = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 200)
+        comment = client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Коммент',
+             'csrfmiddlewaretoken': str(revalidated.context['csrf_token'])})
+        self.assertEqual(comment.status_code, 302)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ProfileExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.other = User.objects.create_user(username='test-reader')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост, с запятой',
+            image=SimpleUploadedFile('export.gif', b'GIF89a',
+                                     content_type='image/gif'))
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Свой коммент')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('posts:profile_export',
+                           kwargs={'username': 'test-author'})
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        cache.clear()
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_and_csv(self):
+        lines = self.download().decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([(r['type'], r['text']) for r in records], [
+            ('post', 'Пост, с запятой'), ('comment', 'Свой коммент')])
+        self.assertEqual(records[1]['post'], self.post.pk)
+
+        rows = list(csv.DictReader(io.StringIO(
+            self.download(format='csv').decode())))
+        self.assertEqual(rows[0]['text'], 'Пост, с запятой')
+        self.assertEqual(rows[0]['image'], self.post.image.name)
+        self.assertEqual(rows[1]['type'], 'comment')
+
+    def test_zip_bundles_images(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.download(zip='1')))
+        self.assertEqual(archive.namelist(),
+                         ['test-author.ndjson', self.post.image.name])
+        self.assertEqual(archive.read(self.post.image.name), b'GIF89a')
+
+    def test_rate_limit_and_access(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        url = reverse('posts:profile_export',
+                      kwargs={'username': 'test-reader'})
+        self.assertRedirects(self.client.get(url), reverse(
+            'posts:profile', kwargs={'username': 'test-reader'}))
+
+
+@override_settings(COMMENTS_PER_PAGE=20)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test-author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Коммент {i}')
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.pk})
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_load_more(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.texts(response),
+                         [f'Коммент {i}' for i in range(24, 4, -1)])
+        comments = response.context['comments']
+        self.assertContains(response, f'?comments={comments.next_cursor}')
+
+        response = self.client.get(self.url,
+                                   {'comments': comments.next_cursor})
+        self.assertEqual(self.texts(response),
+                         [f'Коммент {i}' for i in range(4, -1, -1)])
+        self.assertFalse(response.context['comments'].has_next())
+        self.assertTrue(response.context['comments'].has_previous())
+
+    def test_queries_do_not_grow_with_comments(self):
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        post = Post.objects.create(author=self.user, text='Без комментов')
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('posts:post_detail',
+                                    kwargs={'post_id': post.pk}))
+        self.assertEqual(len(many), len(few))
@@ -0,0 +1,156 @@
+"""Фоновая генерация миниатюр картинок постов.
+
+Сохранённая картинка ставится в очередь (ThumbnailTask), а команда
+thumbnail_worker заранее рендерит для неё все THUMBNAIL_RENDITIONS
+в пуле процессов. Шаблоны берут только готовые миниатюры из
+KV-хранилища sorl и не ресайзят картинки внутри запроса.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+
+from core.cache import bump_generation
+
+from .models import Post, ThumbnailTask
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+# Задачу, взятую упавшим воркером, можно забрать снова через это время
+LEASE = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def _full_options(source, options):
+    """Дополняет опции так же, как ThumbnailBackend.get_thumbnail.
+
+    Имя файла миниатюры считается по полному набору опций, поэтому без
+    этого шага готовую миниатюру в KV-хранилище не найти.
+    """
+    backend = default.backend
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def webp_enabled():
+    return settings.THUMBNAIL_WEBP and features.check('webp')
+
+
+def rendition_names(group=None):
+    """Миниатюры из THUMBNAIL_RENDITIONS (или одной группы srcset) и их
+    WebP-копии с суффиксом .webp, если Pillow умеет WebP."""
+    names = list(settings.THUMBNAIL_SRCSET[group] if group
+                 else settings.THUMBNAIL_RENDITIONS)
+    if webp_enabled():
+        names += [f'{name}.webp' for name in names]
+    return names
+
+
+def rendition_spec(rendition):
+    """(geometry, options) миниатюры; 'card.webp' — 'card' в WebP."""
+    name, _, extension = rendition.partition('.')
+    geometry, options = settings.THUMBNAIL_RENDITIONS[name]
+    if extension == 'webp':
+        options = dict(options, format='WEBP')
+    return geometry, options
+
+
+def _rendition_file(image, rendition):
+    geometry, options = rendition_spec(rendition)
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _full_options(source, options))
+    return ImageFile(name, default.storage)
+
+
+def cached_rendition(image, rendition):
+    """Готовая миниатюра или None, если воркер её ещё не сделал."""
+    if not settings.THUMBNAIL_ASYNC:
+        geometry, options = rendition_spec(rendition)
+        return get_thumbnail(image, geometry, **options)
+    return default.kvstore.get(_rendition_file(image, rendition))
+
+
+def warm_renditions(images, renditions):
+    """Подтягивает записи KV-хранилища sorl для целой страницы разом.
+
+    cached_db при пустом кэше ходит в базу за каждой картинкой отдельно
+    (N+1). Здесь недостающие ключи берутся одним запросом и кладутся
+    в кэш, в том числе пустые — для ещё не готовых миниатюр.
+    """
+    kv_cache = getattr(default.kvstore, 'cache', None)
+    images = [image for image in images if image]
+    if not settings.THUMBNAIL_ASYNC or kv_cache is None or not images:
+        return
+    keys = {add_prefix(_rendition_file(image, rendition).key)
+            for image in images for rendition in renditions}
+    missing = keys - set(kv_cache.get_many(keys))
+    if not missing:
+        return
+    found = dict(KVStore.objects.filter(
+        key__in=missing).values_list('key', 'value'))
+    kv_cache.set_many(
+        {key: found.get(key, EMPTY_VALUE) for key in missing},
+        thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+
+
+def render_renditions(image_name):
+    """Рендерит все миниатюры картинки; выполняется в процессе пула."""
+    image = ImageFile(image_name, image_storage)
+    for rendition in rendition_names():
+        geometry, options = rendition_spec(rendition)
+        get_thumbnail(image, geometry, **options)
+    return image_name
+
+
+def enqueue(image_name):
+    if settings.THUMBNAIL_ASYNC and image_name:
+        ThumbnailTask.objects.get_or_create(image=image_name)
+
+
+def claim(batch):
+    """Забирает до batch задач; чужие свежие задачи не трогает."""
+    now = timezone.now()
+    candidates = ThumbnailTask.objects.filter(
+        attempts__lt=MAX_ATTEMPTS
+    ).exclude(started__gt=now - LEASE)[:batch]
+    claimed = []
+    for task in candidates:
+        # Условный UPDATE: задачу получит только один из воркеров
+        if ThumbnailTask.objects.filter(
+            pk=task.pk, started=task.started
+        ).update(started=now, attempts=F('attempts') + 1):
+            claimed.append(task.image)
+    return claimed
+
+
+def complete(image_names):
+    ThumbnailTask.objects.filter(image__in=image_names).delete()
+    # В закэшированных карточках вместо миниатюры оригинал
+    Post.objects.filter(image__in=image_names).update(updated=timezone.now())
+    # В закэшированных страницах ещё стоят оригиналы вместо миниатюр
+    bump_generation()
+
+
+def fail(image_name, error):
+    logger.error('Не удалось сделать миниатюры %s: %s', image_name, error)
+    ThumbnailTask.objects.filter(image=image_name).update(started=None)
@@ -0,0 +1,172 @@
+"""Потоковые выгрузка и загрузка контента (export_posts, import_posts).
+
+Формат NDJSON — один файл, по объекту на строку, с полем "type";
+формат CSV — каталог с файлом на каждый тип. Записи идут в порядке
+зависимостей: пользователи, группы, посты, комментарии, подписки.
+id сохраняются, поэтому ссылки между записями остаются верными,
+а повторная загрузка уже вставленных строк просто пропускается.
+"""
+import csv
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# (тип записи, модель, поля) в порядке загрузки
+RECORDS = [
+    ('user', User, ('id', 'username', 'first_name', 'last_name', 'email',
+                    'password', 'is_active', 'date_joined')),
+    ('group', Group, ('id', 'title', 'slug', 'description')),
+    ('post', Post, ('id', 'text', 'pub_date', 'updated', 'author_id',
+                    'group_id', 'image')),
+    ('comment', Comment, ('id', 'post_id', 'author_id', 'text', 'created')),
+    ('follow', Follow, ('id', 'user_id', 'author_id')),
+]
+MODELS = {kind: (model, fields) for kind, model, fields in RECORDS}
+
+
+def dump_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def export_rows(model, fields, chunk_size):
+    """Строки модели по возрастанию id без создания объектов."""
+    rows = model.objects.order_by('pk').values_list(*fields)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield [dump_value(value) for value in row]
+
+
+def load_object(kind, record):
+    """Объект модели из записи; пустые строки CSV становятся None."""
+    model, fields = MODELS[kind]
+    values = {}
+    for name in fields:
+        field = model._meta.get_field(name)
+        value = record.get(name)
+        if value == '' and field.null:
+            value = None
+        values[field.attname] = field.to_python(value)
+    return model(**values)
+
+
+def read_ndjson(path):
+    """(тип, номер записи, запись) из NDJSON-файла."""
+    with open(path, encoding='utf-8') as source:
+        for number, line in enumerate(source):
+            if line.strip():
+                record = json.loads(line)
+                yield record.pop('type'), number, record
+
+
+def read_csv(path, kind):
+    with open(path, encoding='utf-8', newline='') as source:
+        for number, record in enumerate(csv.DictReader(source)):
+            yield kind, number, record
+
+
+class NdjsonWriter:
+    def __init__(self, path):
+        self.output = open(path, 'w', encoding='utf-8')
+
+    def write(self, kind, fields, rows):
+        for row in rows:
+            record = {'type': kind}
+            record.update(zip(fields, row))
+            self.output.write(
+                json.dumps(record, ensure_ascii=False,
+                           separators=(',', ':')) + '\n')
+
+    def close(self):
+        self.output.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, kind, fields, rows):
+        with open(os.path.join(self.path, f'{kind}s.csv'), 'w',
+                  encoding='utf-8', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(fields)
+            writer.writerows(
+                ['' if value is None else value for value in row]
+                for row in rows)
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def keep_dates():
+    """Даёт bulk_create записать даты из выгрузки.
+
+    auto_now и auto_now_add иначе перезаписывают их текущим временем.
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def copy_to_storage(source_dir, name):
+    """Копирует картинку из каталога выгрузки в хранилище медиа."""
+    if default_storage.exists(name):
+        return name
+    with open(os.path.join(source_dir, name), 'rb') as image:
+        return default_storage.save(name, File(image))
+
+
+def copy_from_storage(target_dir, name):
+    target = os.path.join(target_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with default_storage.open(name) as image, open(target, 'wb') as output:
+        for chunk in image.chunks():
+            output.write(chunk)
+    return name
+
+
+class Checkpoint:
+    """Сколько записей каждого источника уже загружено.
+
+    Пишется после каждой закоммиченной пачки через os.replace, поэтому
+    после падения загрузка продолжается с последней целой пачки.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as source:
+                self.done = json.load(source)
+
+    def skip(self, source, number):
+        return number < self.done.get(source, 0)
+
+    def save(self, source, count):
+        self.done[source] = count
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as output:
+            json.dump(self.done, output)
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -9,6 +9,9 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
+    # Выгрузка своих постов и комментариев
+    path('profile/<str:username>/export/', views.profile_export,
+         name='profile_export'),
     # Просмотр записи
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     # Изменение записи
@@ -18,6 +21,8 @@ urlpatterns = [
     # Создание коммента
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
+    # Поиск по постам и комментариям
+    path('search/', views.search, name='search'),
     # Страница подписок
     path('follow/', views.follow_index, name='follow_index'),
     # Подписка
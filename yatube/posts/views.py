@@ -1,22 +1,51 @@
+import hashlib
+from urllib.parse import urlencode
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.cache import (conditional_page, generation_etag,
+                        generation_last_modified, user_tag)
+from core.esi import cache_page_shared
+
+from . import exports, feeds
+from .cards import render_cards
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Follow, Group, Post, User
+from .paginators import (CachedCountPaginator, CursorPaginator,
+                         WindowedPaginator)
+from .search import search_posts
+from .thumbnails import rendition_names, warm_renditions
+
+
+def attach_cards(page_obj, author=None, group=None):
+    """Грузит посты страницы и их карточки из кэша разом."""
+    page_obj.object_list = list(page_obj.object_list)
+    page_obj.cards = render_cards(page_obj.object_list, author, group)
+    return page_obj
+
 
+def paginate(req, pag_post, author=None, group=None):
+    # Keyset-режим: глубокие страницы без COUNT(*) и OFFSET
+    if settings.PAGINATION_MODE == 'keyset' or 'cursor' in req.GET:
+        paginator = CursorPaginator(pag_post, settings.AMOUNT_OF_POSTS)
+        return attach_cards(paginator.get_page(req.GET.get('cursor')),
+                            author, group)
 
-def paginate(req, pag_post):
-    paginator = Paginator(pag_post, settings.AMOUNT_OF_POSTS)
+    # Номера страниц окном вокруг текущей, число постов — из кэша
+    paginator = CachedCountPaginator(pag_post, settings.AMOUNT_OF_POSTS)
     page_number = req.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    return page_obj
+    return attach_cards(page_obj, author, group)
 
 
-@cache_page(20, key_prefix='index_page')
+@conditional_page(generation_etag, generation_last_modified)
+@cache_page_shared(settings.PAGE_CACHE_TIMEOUT, key_prefix='index_page')
 def index(request):
     template = 'posts/index.html'
     posts = Post.objects.select_related('group', 'author')
@@ -30,11 +59,13 @@ def index(request):
     return render(request, template, context)
 
 
+@conditional_page(generation_etag, generation_last_modified)
+@cache_page_shared(settings.PAGE_CACHE_TIMEOUT, key_prefix='group_page')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     posts = group.posts.select_related('author')
 
-    page_obj = paginate(request, posts)
+    page_obj = paginate(request, posts, group=group)
 
     template = 'posts/group_list.html'
     context = {
@@ -45,37 +76,68 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@conditional_page(generation_etag, generation_last_modified)
+@cache_page_shared(settings.PAGE_CACHE_TIMEOUT, key_prefix='profile_page')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
     posts_auth = author.posts.select_related('group')
 
-    following = None
-    following = (request.user.is_authenticated
-                 and Follow.objects.filter(author=author).exists())
-
-    page_obj = paginate(request, posts_auth)
+    page_obj = paginate(request, posts_auth, author=author)
 
     context = {
         'author': author,
         'posts_auth': posts_auth,
         'page_obj': page_obj,
-        'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_version(request, post_id):
+    """Всё, от чего зависит страница поста, одним запросом."""
+    if not hasattr(request, '_post_version'):
+        last_comment = Comment.objects.filter(
+            post=OuterRef('pk')).order_by('-created').values('created')[:1]
+        rows = Post.objects.filter(pk=post_id).order_by().annotate(
+            last_comment=Subquery(last_comment)
+        ).values_list('updated', 'last_comment', 'comments_count',
+                      'author__stats__posts_count')[:1]
+        request._post_version = rows[0] if rows else None
+    return request._post_version
+
+
+def post_etag(request, post_id):
+    version = post_version(request, post_id)
+    if version is None:
+        return None
+    parts = [str(part) for part in version] + [
+        user_tag(request), request.GET.urlencode()]
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def post_last_modified(request, post_id):
+    version = post_version(request, post_id)
+    if version is None or request.user.is_authenticated:
+        return None
+    return max(date for date in version[:2] if date)
+
+
+@conditional_page(post_etag, post_last_modified)
+@cache_page_shared(settings.PAGE_CACHE_TIMEOUT, key_prefix='post_page')
 def post_detail(request, post_id):
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
+    warm_renditions([post.image], rendition_names('card'))
 
-    comments = post.comments.all()
-    form = CommentForm()
+    # Комментариев бывают тысячи: страница курсором от новых к старым
+    comments = CursorPaginator(
+        post.comments.select_related('author'), settings.COMMENTS_PER_PAGE,
+        ordering=('created', 'id')).get_page(request.GET.get('comments'))
 
     context = {
         'post': post,
-        'posts_by': post.author.posts.all(),
         'comments': comments,
-        'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
@@ -134,12 +196,54 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+EXPORT_FORMATS = {
+    'ndjson': (exports.ndjson_lines, 'application/x-ndjson'),
+    'csv': (exports.csv_lines, 'text/csv'),
+}
+
+
 @login_required
-def follow_index(request):
-    posts_follow = Post.objects.filter(
-        author__following__user=request.user)
+def profile_export(request, username):
+    """Потоковая выгрузка своих постов и комментариев (?zip=1 — архивом
+    вместе с картинками)."""
+    if username != request.user.username:
+        return redirect('posts:profile', username)
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse('Неизвестный формат', status=400)
+    # Не чаще раза в EXPORT_INTERVAL: выгрузка большого автора дорогая
+    if not cache.add(f'export:{request.user.pk}', True,
+                     settings.EXPORT_INTERVAL):
+        response = HttpResponse('Слишком частая выгрузка', status=429)
+        response['Retry-After'] = settings.EXPORT_INTERVAL
+        return response
+
+    to_lines, content_type = EXPORT_FORMATS[fmt]
+    lines = to_lines(exports.history_records(request.user))
+    filename = f'{username}.{fmt}'
+    if request.GET.get('zip'):
+        content_type = 'application/zip'
+        content = exports.zip_chunks(request.user, lines, filename)
+        filename = f'{username}.zip'
+    else:
+        content = lines
+        content_type += '; charset=utf-8'
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 
-    page_obj = paginate(request, posts_follow)
+@login_required
+def follow_index(request):
+    # Лента хранит только id, посты страницы достаём одним запросом
+    page_obj = WindowedPaginator(feeds.get_feed_ids(request.user),
+                                 settings.AMOUNT_OF_POSTS).get_page(
+                                     request.GET.get('page'))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list)
+    page_obj.object_list = [posts[pk] for pk in page_obj.object_list
+                            if pk in posts]
+    attach_cards(page_obj)
 
     context = {
         'page_obj': page_obj
@@ -163,3 +267,19 @@ def profile_unfollow(request, username):
                           author__username=username).delete()
 
     return redirect('posts:profile', username)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = attach_cards(WindowedPaginator(
+            search_posts(query), settings.AMOUNT_OF_POSTS).get_page(
+                request.GET.get('page')))
+
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
@@ -33,6 +33,26 @@ ALLOWED_HOSTS = [
 ]
 
 AMOUNT_OF_POSTS = 10
+# Комментариев на странице поста; остальные — по ссылке «ранее»
+COMMENTS_PER_PAGE = 20
+
+# 'offset' — номера страниц, 'keyset' — курсоры по (pub_date, id)
+PAGINATION_MODE = 'offset'
+# Число постов для номеров страниц берётся из кэша: свежим считается
+# PAGINATOR_COUNT_TTL секунд, затем пересчитывается в фоне, а вовсе
+# выпадает из кэша через PAGINATOR_COUNT_TIMEOUT
+PAGINATOR_COUNT_TTL = 60
+PAGINATOR_COUNT_TIMEOUT = 60 * 60 * 24
+PAGINATOR_COUNT_ASYNC = True
+
+# Ленты подписок (posts.feeds): длина, как часто срезать лишнее
+# и порог «знаменитости», после которого посты автора
+# не раскладываются по лентам подписчиков
+FEED_MAX_LENGTH = 1000
+FEED_TRIM_EVERY = 100
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+# Массивы id подписок и подписчиков (posts.follow_graph)
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
 
 
 # Application definition
@@ -48,15 +68,20 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,7 +91,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,6 +107,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+# Потоков, в которых yatube.asgi выполняет синхронные представления
+ASGI_THREADS = int(os.environ.get('YATUBE_ASGI_THREADS', 8))
 
 
 # Database
@@ -91,16 +118,80 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами воркера, PRAGMA не повторяются
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Реплики только для чтения (core.routers): пути к копиям базы через
+# запятую, например YATUBE_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+REPLICA_DATABASES = []
+for number, path in enumerate(
+        filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], NAME=path)
+    REPLICA_DATABASES.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Страницы, которые читают с реплик, и приложения, чьи модели там читаются
+REPLICA_VIEWS = [
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+    'posts:search',
+    'api:posts',
+    'api:post_detail',
+    'api:comments',
+    'api:feed',
+    'api:groups',
+    'api:group_detail',
+    'api:user_detail',
+]
+REPLICA_APPS = ['posts', 'auth']
+# После записи пользователь столько секунд читает с primary
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'db_primary_until'
+# Как часто перепроверять реплику, в том числе исключённую
+REPLICA_HEALTH_INTERVAL = 5
+
+# PRAGMA для каждого нового соединения SQLite (core.db): WAL, чтобы
+# чтение не ждало записи, и ожидание блокировки вместо «database is
+# locked». Сравнение с голой базой: python benchmarks/sqlite_stress.py
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
 # Cache
+# Файловый кэш общий для всех воркеров на хосте и переживает рестарты.
+# Тесты идут с yatube.settings_test, где кэш свой, в памяти.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "core.timing.FileBasedCache",
+        "LOCATION": os.environ.get(
+            'YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        "TIMEOUT": 60 * 60 * 24,
+        # Каждая запись меняет поколение и бросает все страницы, поэтому
+        # файлов много не нужно; сверяется с лимитом раз в CULL_INTERVAL
+        "OPTIONS": {
+            "MAX_ENTRIES": 20000,
+            "CULL_INTERVAL": 10,
+        },
     }
 }
 
+# Страницы лент живут долго: актуальность держит поколение кэша,
+# которое меняется при каждой записи (core.cache)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Карточки постов (posts.cards) версионируются полем Post.updated
+CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Выгрузка истории (posts:profile_export) — не чаще раза в столько секунд
+EXPORT_INTERVAL = 60
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -155,7 +246,73 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Бюджеты SQL-запросов страниц по имени URL (core.middleware).
+# Число запросов не должно зависеть от размера страницы
+QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_list': 7,
+    'posts:profile': 8,
+    'posts:post_detail': 6,
+    'posts:follow_index': 6,
+    'posts:search': 7,
+}
+QUERY_BUDGET_RAISE = DEBUG
+
+# Частота записей (core.ratelimit) по имени URL: ведро на пользователя
+# и на IP как (ёмкость, секунд на полное наполнение). Считаются запросы
+# с методами из methods, по умолчанию только POST
+RATE_LIMITS = {
+    'posts:post_create': {'user': (10, 10 * 60), 'ip': (30, 10 * 60)},
+    'posts:add_comment': {'user': (20, 60), 'ip': (60, 60)},
+    # Подписка — GET-ссылка со страницы профиля
+    'posts:profile_follow': {'methods': ['GET', 'POST'],
+                             'user': (30, 60), 'ip': (100, 60)},
+    'users:signup': {'ip': (5, 60 * 60)},
+    # Те же записи через API; пользователь берётся из токена
+    'api:posts': {'user': (10, 10 * 60), 'ip': (30, 10 * 60)},
+    'api:comments': {'user': (20, 60), 'ip': (60, 60)},
+    'api:follows': {'user': (30, 60), 'ip': (100, 60)},
+    # Подбор пароля через выдачу токена
+    'api:token': {'ip': (10, 10 * 60)},
+}
+
+# Замеры запроса (core.middleware.ServerTimingMiddleware): заголовок
+# Server-Timing раскрывает устройство сайта, поэтому только в DEBUG
+SERVER_TIMING = DEBUG
+# Доля запросов под cProfile; отдельный запрос можно снять ссылкой
+# из manage.py profile_link <путь>
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Миниатюры: готовятся заранее воркером (manage.py thumbnail_worker),
+# шаблоны до готовности показывают оригинал
+THUMBNAIL_ASYNC = True
+THUMBNAIL_RENDITIONS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_small': ('480x170', {'crop': 'center', 'upscale': True}),
+}
+# Группы для srcset: {% picture post.image "card" %} отдаёт все размеры
+THUMBNAIL_SRCSET = {
+    'card': ['card_small', 'card'],
+}
+# Рядом с JPEG делать WebP-копии миниатюр, если Pillow собран с WebP
+THUMBNAIL_WEBP = True
+
+# Загрузки (posts.images): больше этого не принимаем, а принятое
+# пересохраняем с длинной стороной не больше IMAGE_MAX_SIDE
+IMAGE_MAX_BYTES = 20 * 2 ** 20
+IMAGE_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_MAX_SIDE = 2048
+IMAGE_JPEG_QUALITY = 85
+
+# Поиск: 'auto' — FTS5 на SQLite, иначе таблица SearchTerm;
+# 'fts5' и 'table' включают бэкенд явно
+SEARCH_BACKEND = 'auto'
+
 # Media URLs
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Столько секунд файл, снова отданный загрузке, не удаляется (posts.blobs)
+MEDIA_REUSE_GRACE = 60
@@ -0,0 +1,20 @@
+"""Настройки тестов: manage.py test --settings=yatube.settings_test."""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# Свой кэш в памяти: тесты не видят данные прошлых прогонов
+CACHES = {
+    "default": {
+        "BACKEND": "core.timing.LocMemCache",
+    }
+}
+# Поток с отдельным соединением не видит данных тестовой транзакции
+PAGINATOR_COUNT_ASYNC = False
+# Реплика-зеркало тестовой базы; включается в тестах через
+# override_settings(REPLICA_DATABASES=['replica'])
+DATABASES['replica'] = dict(DATABASES['default'],
+                            TEST={'MIRROR': 'default'})
+QUERY_BUDGET_RAISE = True
+# Тестовый клиент всегда приходит с 127.0.0.1; лимиты включают
+# только тесты самого лимитера
+RATE_LIMITS = {}
@@ -24,6 +24,7 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls')),
+    path('api/v1/', include('api.urls')),
 ]
 
 handler404 = 'core.views.page_not_found'